@@ -0,0 +1,284 @@
+# schedule and eir benchmarks on synthetic loan tapes
+# times every generate_loan_repayment_schedule variant, the batch engine, eir solving, the eir interest step and
+# csv / parquet output, with the tracemalloc peak of each stage, and saves the results as a json baseline
+# usage: python benchmarks/portfolio.py --sizes 1000 10000 100000 --save baseline.json
+#        python benchmarks/portfolio.py --compare baseline.json
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+frequencies = ['monthly', 'quarterly', 'termly', 'bi-annually', 'yearly']
+
+# the per-loan scripts and the arguments they take (eirgen has no interest method, base days or interest type)
+variants = [
+    ('finaleir', 10),
+    ('armotizedeir', 10),
+    ('eirworking', 10),
+    ('eir', 10),
+    ('eirgen', 7),
+    ('armnew', 10),
+]
+
+arguments = ['loanstartdate', 'loanenddate', 'originalamount', 'repaymentfrequency', 'interestrate', 'upfrontfee',
+             'repaymenttype', 'interest_calculation_method', 'base_days', 'interest_type']
+
+
+def synthetic_tape(num_loans, seed=0):
+    # loan tape mixing every frequency, repayment type, interest method, base days and interest type
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2015-01-01') + rng.integers(0, 10 * 365, num_loans).astype('timedelta64[D]')
+    years = rng.integers(1, 21, num_loans)
+    months = start.astype('datetime64[M]') + (years * 12).astype('timedelta64[M]')
+    day = start - start.astype('datetime64[M]').astype('datetime64[D]')
+    end = np.minimum(months.astype('datetime64[D]') + day, (months + 1).astype('datetime64[D]') - 1)
+    amount = np.round(np.exp(rng.normal(10, 1, num_loans)), 2)
+    return pd.DataFrame({
+        'loanid': np.arange(num_loans),
+        'loanstartdate': start.astype(str),
+        'loanenddate': end.astype(str),
+        'originalamount': amount,
+        'repaymentfrequency': rng.choice(frequencies, num_loans),
+        'interestrate': np.round(rng.uniform(2, 25, num_loans), 2),
+        'upfrontfee': np.round(amount * rng.uniform(0, 0.03, num_loans), 2),
+        'repaymenttype': rng.choice(['emi', 'fpi'], num_loans),
+        'interest_calculation_method': rng.choice(['monthly', 'daily'], num_loans),
+        'base_days': rng.choice([360, 365], num_loans),
+        'interest_type': rng.choice(['variable', 'flatrate'], num_loans, p=[0.8, 0.2]),
+    })
+
+
+def chunks(tape, chunksize):
+    for start in range(0, len(tape), chunksize):
+        yield tape.iloc[start:start + chunksize]
+
+
+def measure(function, repeat=1, memory=True):
+    # best wall time of `repeat` runs, then the tracemalloc peak of one more run
+    seconds = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - started)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def scalar_stages(tape, sample):
+    # the per-loan scripts run on a sample of every repayment type, except armotizedeir: it only sets its installment
+    # for emi loans and raises UnboundLocalError on fpi loans, so it runs on the emi loans of the sample
+    loans = tape.iloc[:sample]
+    emi = (loans['repaymenttype'] == 'emi').values
+    all_rows = [tuple(loan) for loan in loans[arguments].itertuples(index=False)]
+    emi_rows = [row for row, is_emi in zip(all_rows, emi) if is_emi]
+    stages = []
+    for name, num_arguments in variants:
+        generate = importlib.import_module('eir.' + name).generate_loan_repayment_schedule
+        rows = emi_rows if name == 'armotizedeir' else all_rows
+
+        def run(generate=generate, num_arguments=num_arguments, rows=rows):
+            for row in rows:
+                generate(*row[:num_arguments])
+        stages.append(('schedule', name, len(rows), run))
+
+    # eirfunc solves level installments, those of the emi loans
+    from eir.eirsolver import eirfunc
+    from eir.schedule import generate_portfolio_schedule
+    loans = loans[emi]
+    schedule = generate_portfolio_schedule(loans)
+    pv = (loans['originalamount'] - loans['upfrontfee']).tolist()
+    calls = list(zip(schedule.installment.tolist(), schedule.num_repayments.tolist(), pv))
+
+    def solve_each():
+        for call in calls:
+            eirfunc(*call)
+    stages.append(('eirfunc', 'scalar', len(calls), solve_each))
+    return stages
+
+
+def batch_stages(tape, chunksize):
+    from eir.amortization import amortize_schedule
+    from eir.cache import ScheduleCache
+    from eir.eirsolver import eirfunc
+    from eir.pipeline import compute_chunk
+    from eir.schedule import generate_portfolio_schedule
+
+    def schedules():
+        for chunk in chunks(tape, chunksize):
+            generate_portfolio_schedule(chunk)
+
+    def cached_schedules():
+        cache = ScheduleCache()
+        for chunk in chunks(tape, chunksize):
+            cache.schedule(chunk)
+
+    # inputs of the eir stages, prepared outside the timings
+    prepared = []
+    for chunk in chunks(tape, chunksize):
+        schedule = generate_portfolio_schedule(chunk)
+        prepared.append((chunk, schedule, np.asarray(chunk['upfrontfee'], dtype=np.float64)))
+
+    def solve():
+        for chunk, schedule, upfrontfee in prepared:
+            eirfunc(schedule.installment, schedule.num_repayments, chunk['originalamount'].values - upfrontfee)
+
+    def ipmt():
+        # the npf.ipmt eir interest step finaleir used to take, over the padded loans x periods matrix
+        import numpy_financial as npf
+        for chunk, schedule, upfrontfee in prepared:
+            eir = eirfunc(schedule.installment, schedule.num_repayments, chunk['originalamount'].values - upfrontfee)
+            rate = (eir / 100 / 12 / schedule.repayment_interval)[:, None]
+            periods = np.arange(1, schedule.num_periods + 1)
+            with np.errstate(all='ignore'):
+                np.where(schedule.period_mask(), -npf.ipmt(rate, periods, schedule.num_repayments[:, None],
+                                                            (chunk['originalamount'].values - upfrontfee)[:, None]),
+                         np.nan)
+
+    def amortize():
+        for chunk, schedule, upfrontfee in prepared:
+            amortize_schedule(schedule, upfrontfee)
+
+    def pipeline():
+        for chunk in chunks(tape, chunksize):
+            compute_chunk(chunk)
+
+    num_loans = len(tape)
+    return [
+        ('schedule', 'batch', num_loans, schedules),
+        ('schedule', 'batch-cached', num_loans, cached_schedules),
+        ('eirfunc', 'batch', num_loans, solve),
+        ('eirinterest', 'npf.ipmt', num_loans, ipmt),
+        ('eirinterest', 'amortize', num_loans, amortize),
+        ('pipeline', 'compute_chunk', num_loans, pipeline),
+    ]
+
+
+def output_stages(tape, chunksize, directory):
+    # output of one chunk, csv always and parquet when pyarrow is installed
+    from eir.pipeline import compute_chunk
+    chunk = tape.iloc[:chunksize]
+    table = compute_chunk(chunk)
+    frame = table.to_pandas()
+    stages = [('output', 'csv', len(chunk), lambda: frame.to_csv(os.path.join(directory, 'out.csv'), index=False))]
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print('pyarrow is not installed, skipping parquet output', file=sys.stderr)
+    else:
+        from eir.parquetout import ParquetScheduleWriter
+
+        def parquet():
+            with ParquetScheduleWriter(os.path.join(directory, 'out.parquet')) as writer:
+                writer.append(table)
+
+        stages.append(('output', 'parquet', len(chunk), parquet))
+    return stages, len(frame)
+
+
+def environment():
+    import pandas as pd
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        from importlib.metadata import version
+        package = version('eir')
+    except Exception:
+        package = None
+    return {'package': package, 'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def run(sizes, sample, chunksize, repeat, memory, seed):
+    results = []
+    for num_loans in sizes:
+        tape = synthetic_tape(num_loans, seed)
+        stages = batch_stages(tape, chunksize)
+        if sample:
+            stages = scalar_stages(tape, sample) + stages
+        with tempfile.TemporaryDirectory() as directory:
+            written, rows = output_stages(tape, chunksize, directory)
+            for stage, variant, loans, function in stages + written:
+                seconds, peak = measure(function, repeat, memory)
+                result = {'stage': stage, 'variant': variant, 'size': num_loans, 'loans': loans,
+                          'seconds': seconds, 'loans_per_second': loans / seconds, 'peak_bytes': peak}
+                if stage == 'output':
+                    result['rows'] = rows
+                results.append(result)
+                print('%8d  %-12s %-14s %8d loans %10.3fs %12.0f loans/s %10s' % (
+                    num_loans, stage, variant, loans, seconds, loans / seconds,
+                    '-' if peak is None else '%.1f MB' % (peak / 2 ** 20)), file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # (stage, variant, size) entries whose throughput dropped by more than tolerance against the baseline
+    previous = {(entry['stage'], entry['variant'], entry['size']): entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry['stage'], entry['variant'], entry['size']))
+        if old is None:
+            continue
+        ratio = entry['loans_per_second'] / old['loans_per_second']
+        flag = ''
+        if ratio < 1 - tolerance:
+            regressions.append(entry)
+            flag = '  REGRESSION'
+        print('%8d  %-12s %-14s %6.2fx%s' % (entry['size'], entry['stage'], entry['variant'], ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='tape sizes in loans (up to 1000000)')
+    parser.add_argument('--sample', type=int, default=200,
+                        help='loans timed through the per-loan scripts (0 skips them)')
+    parser.add_argument('--chunksize', type=int, default=20000, help='loans per batch chunk')
+    parser.add_argument('--repeat', type=int, default=1, help='timed runs per stage, the best one is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak memory runs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the results to this json file')
+    parser.add_argument('--compare', help='baseline json to compare the results against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='throughput drop against the baseline reported as a regression (default: 0.2)')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.sample, args.chunksize, args.repeat, not args.no_memory, args.seed)
+    report = {'environment': environment(), 'settings': {'sample': args.sample, 'chunksize': args.chunksize,
+                                                         'repeat': args.repeat, 'seed': args.seed},
+              'results': results}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# load test of the quote server: concurrent connections each send one quote request at a time and the
+# latencies are reported as p50 / p99 with the overall throughput
+# usage: eir serve --port 8765 &
+#        python benchmarks/quoteload.py --port 8765 --concurrency 64 --requests 20000
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from portfolio import arguments, synthetic_tape  # noqa: E402
+
+
+async def connection(open_connection, requests, latencies, errors, schedule):
+    reader, writer = await open_connection()
+    for request in requests:
+        request['schedule'] = schedule
+        started = time.perf_counter()
+        writer.write((json.dumps(request) + '\n').encode())
+        await writer.drain()
+        answer = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - started)
+        if 'error' in answer:
+            errors.append(answer['error'])
+    writer.close()
+
+
+async def server_stats(open_connection):
+    reader, writer = await open_connection()
+    writer.write(b'{"stats": true}\n')
+    await writer.drain()
+    stats = json.loads(await reader.readline())
+    writer.close()
+    return stats
+
+
+async def run(args):
+    if args.unix:
+        def open_connection():
+            return asyncio.open_unix_connection(args.unix)
+    else:
+        def open_connection():
+            return asyncio.open_connection(args.host, args.port)
+
+    tape = synthetic_tape(args.requests, args.seed)[arguments]
+    requests = [dict(zip(arguments, row), id=i) for i, row in enumerate(tape.itertuples(index=False))]
+    for request in requests:
+        request['base_days'] = int(request['base_days'])
+    latencies = []
+    errors = []
+    before = await server_stats(open_connection)
+    started = time.perf_counter()
+    await asyncio.gather(*[connection(open_connection, requests[i::args.concurrency], latencies, errors,
+                                      args.schedule)
+                           for i in range(args.concurrency)])
+    seconds = time.perf_counter() - started
+    after = await server_stats(open_connection)
+
+    latencies = np.array(latencies) * 1000
+    batches = after['batches'] - before['batches']
+    print('%d requests over %d connections in %.2fs: %.0f quotes/s' % (len(latencies), args.concurrency, seconds,
+                                                                      len(latencies) / seconds))
+    print('latency p50 %.2f ms, p99 %.2f ms, max %.2f ms' % (np.percentile(latencies, 50),
+                                                              np.percentile(latencies, 99), latencies.max()))
+    print('%d batches, %.1f quotes per batch, %d errors' % (batches, (after['requests'] - before['requests'])
+                                                            / max(batches, 1), len(errors)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='connect to this unix socket instead')
+    parser.add_argument('--concurrency', type=int, default=64, help='concurrent connections')
+    parser.add_argument('--requests', type=int, default=10000, help='quote requests in total')
+    parser.add_argument('--schedule', action='store_true', help='ask for the repayment schedules too')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# import time of the eir package in a fresh interpreter, the cost every short-lived batch worker pays
+# usage: python benchmarks/startup.py [--repeat 20]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+statements = [
+    ('interpreter', 'pass'),
+    ('import eir', 'import eir'),
+    ('import eir.finaleir', 'import eir.finaleir'),
+    ('import eir.armnew', 'import eir.armnew'),
+    ('import eir.schedule', 'import eir.schedule'),
+    ('import eir.cli', 'import eir.cli'),
+    ('first schedule (finaleir)', "from eir.finaleir import generate_loan_repayment_schedule as g; "
+                                  "g('2023-01-31', '2025-01-31', 10000, 'monthly', 5, 200, 'emi', 'monthly', 365, "
+                                  "'variable')"),
+]
+
+
+def time_statement(statement, repeat):
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True, env=env, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for label, statement in statements:
+        print('%-28s %8.1f ms' % (label, time_statement(statement, args.repeat) * 1000))
+
+
+if __name__ == '__main__':
+    main()
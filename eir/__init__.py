@@ -0,0 +1,31 @@
+# eir: loan repayment schedules and upfront fee amortization under the effective interest rate
+# the public functions are loaded on first use, so importing the package does not pull in numpy or pandas
+import importlib
+
+_exports = {
+    'intervals': 'schedule',
+    'loan_columns': 'schedule',
+    'PortfolioSchedule': 'schedule',
+    'generate_portfolio_schedule': 'schedule',
+    'EIRSolution': 'eirsolver',
+    'solve_eir': 'eirsolver',
+    'solve_cashflow_eir': 'eirsolver',
+    'eirfunc': 'eirsolver',
+    'Amortization': 'amortization',
+    'amortize': 'amortization',
+    'amortize_schedule': 'amortization',
+}
+
+__all__ = sorted(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module('.' + _exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
@@ -0,0 +1,108 @@
+# reporting-period roll-ups: principal, interest, eir interest and amortized fee per month and segment
+# each chunk's repayments are scatter-added (np.bincount) into month x segment buckets as the chunk is computed,
+# so a whole book is reported in one pass over the tape without keeping its schedules
+import numpy as np
+
+from .columnar import amount_columns
+
+# amounts rolled up by default
+report_columns = ['Principal', 'Interest', 'eirinterest', 'armortizedfee']
+
+
+def segment_labels(loans, by):
+    # the segment columns of a chunk of the tape, one label array per column
+    return [np.asarray(loans[name]).astype(str) for name in by]
+
+
+class ReportingAggregator:
+    # totals of the columns per reporting month (the month of the repayment date) and segment (one label per
+    # `by` column); NaN amounts count as zero, like a pandas groupby sum; subclasses set unit to bucket the dates
+    # by another datetime64 unit
+    unit = 'M'
+
+    def __init__(self, by=(), columns=None):
+        self.by = list(by)
+        self.columns = list(report_columns if columns is None else columns)
+        self._rows = [amount_columns.index(name) for name in self.columns]
+        self._segments = {}
+        self._first_month = None
+        self._totals = np.zeros((len(self.columns), 0, 0))
+
+    def _segment_codes(self, labels, num_loans):
+        # code per loan of its segment, adding the segments seen for the first time
+        if not self.by:
+            if not self._segments:
+                self._segments[()] = 0
+            return np.zeros(num_loans, dtype=np.int64)
+        keys = np.empty(num_loans, dtype=[(str(i), labels[i].dtype) for i in range(len(labels))])
+        for i, values in enumerate(labels):
+            keys[str(i)] = values
+        unique, inverse = np.unique(keys, return_inverse=True)
+        codes = np.array([self._segments.setdefault(key, len(self._segments)) for key in unique.tolist()],
+                         dtype=np.int64)
+        return codes[inverse.ravel()]
+
+    def _grow(self, first_month, last_month):
+        # widen the totals to cover the months first_month..last_month and every known segment
+        if self._first_month is None:
+            self._first_month = first_month
+        start = min(self._first_month, first_month)
+        num_months = max(self._first_month + self._totals.shape[1], last_month + 1) - start
+        shape = (len(self.columns), num_months, len(self._segments))
+        if shape != self._totals.shape or start != self._first_month:
+            totals = np.zeros(shape)
+            offset = self._first_month - start
+            totals[:, offset:offset + self._totals.shape[1], :self._totals.shape[2]] = self._totals
+            self._totals = totals
+            self._first_month = start
+
+    def add(self, table, labels=None):
+        # scatter-add the repayments of a ScheduleTable; labels are the segment labels of its loans
+        if not len(table):
+            return
+        segment = self._segment_codes(labels, len(table.loanids))[table.loan]
+        month = table.date.astype('datetime64[%s]' % self.unit).astype(np.int64)
+        first_month, last_month = int(month.min()), int(month.max())
+        self._grow(first_month, last_month)
+
+        # flat bucket per repayment over this chunk's months and all segments
+        num_months = last_month - first_month + 1
+        num_segments = len(self._segments)
+        bucket = (month - first_month) * num_segments + segment
+        offset = first_month - self._first_month
+        for i, row in enumerate(self._rows):
+            sums = np.bincount(bucket, weights=np.nan_to_num(table.amounts[row]),
+                               minlength=num_months * num_segments)
+            self._totals[i, offset:offset + num_months] += sums.reshape(num_months, num_segments)
+
+    def to_frame(self):
+        # one row per month end and segment with non-zero totals, in month then segment order
+        import pandas as pd
+        month, segment = np.nonzero(np.any(self._totals != 0, axis=0))
+        months = (np.arange(self._totals.shape[1]) + (self._first_month or 0)).astype('datetime64[M]')
+        frame = pd.DataFrame({'month': (months[month] + 1).astype('datetime64[D]') - 1})
+        segments = list(self._segments)
+        for i, name in enumerate(self.by):
+            frame[name] = [segments[code][i] for code in segment]
+        for i, name in enumerate(self.columns):
+            frame[name] = self._totals[i, month, segment]
+        return frame
+
+
+def accumulate_tape(aggregator, tape, chunksize=100000, workers=1, cache_bytes=None, roll='carry', curve=None):
+    # adds the schedules of a loan tape to aggregator (a ReportingAggregator or subclass) by its segments, computing
+    # and dropping them chunk by chunk
+    from .pipeline import read_tape
+    from .runner import map_labelled_shards
+
+    chunks = ((chunk, segment_labels(chunk, aggregator.by)) for chunk in read_tape(tape, chunksize))
+    for result, labels in map_labelled_shards(chunks, workers, cache_bytes=cache_bytes, roll=roll, curve=curve):
+        aggregator.add(result.table, labels)
+    return aggregator
+
+
+def aggregate_tape(tape, by=(), chunksize=100000, workers=1, cache_bytes=None, roll='carry', curve=None,
+                   columns=None):
+    # month-end totals of a loan tape by segment
+    return accumulate_tape(ReportingAggregator(by, columns), tape, chunksize, workers, cache_bytes, roll,
+                           curve).to_frame()
@@ -0,0 +1,74 @@
+# amortized cost under the effective interest method
+# the eir is solved once per loan; the carrying amount after each period is the rest of the cash flows discounted at
+# the eir, and eir interest the change in it plus the cash flow (carrying amount * eir, apart from rounding), so the
+# amortized fee adds up to the upfront fee less any contractual balance left after the last repayment
+from collections import namedtuple
+
+import numpy as np
+
+from . import instrument
+from .eirsolver import solve_cashflow_eir
+
+# loans x periods arrays except eir and converged, which are per loan; eir is the periodic rate
+Amortization = namedtuple('Amortization', ['eir', 'converged', 'eirinterest', 'eirprincipal',
+                                           'eirrunningbalance', 'amortizedfee'])
+
+
+@instrument.timed('eir.amortize')
+def amortize(cashflows, carrying_amount, interest=None, eir=None):
+    # cashflows are the contractual payments (loans x periods, NaN after the last one), carrying_amount
+    # the initial amortized cost (amount less upfront fee); interest, when given, is the contractual
+    # interest the amortized fee is measured against; eir skips the solve when already known
+    cashflows = np.atleast_2d(np.asarray(cashflows, dtype=np.float64))
+    carrying_amount = np.asarray(carrying_amount, dtype=np.float64).ravel()
+    if eir is None:
+        solution = solve_cashflow_eir(cashflows, carrying_amount)
+        eir, converged = solution.rate, solution.converged
+    else:
+        eir = np.broadcast_to(np.asarray(eir, dtype=np.float64), carrying_amount.shape)
+        converged = np.isfinite(eir)
+
+    # the carrying amount after each period is the rest of the cash flows discounted at the eir, rebuilt back from
+    # the last repayment, where it is zero; rolling the amount forward instead would multiply the solver's residual
+    # by (1 + eir) ** k, which on loans with a very high eir leaves the fee unreconciled
+    growth = 1 + eir
+    closing = np.empty_like(cashflows)
+    remaining = np.zeros(len(carrying_amount))
+    for k in range(cashflows.shape[1] - 1, -1, -1):
+        closing[:, k] = remaining
+        remaining = (remaining + np.nan_to_num(cashflows[:, k])) / growth
+    eirrunningbalance = np.concatenate([carrying_amount[:, None], closing[:, :-1]], axis=1)[:, :cashflows.shape[1]]
+    # eir interest is the change in the carrying amount, so the first period takes up what separates the booked
+    # carrying amount from the discounted flows and the total eir interest is the cash flows less that amount
+    eirinterest = closing - eirrunningbalance + cashflows
+    eirprincipal = cashflows - eirinterest
+
+    # periods past the end of a loan stay NaN like the cash flows
+    padding = np.isnan(cashflows)
+    eirinterest[padding] = np.nan
+    eirrunningbalance[padding] = np.nan
+
+    amortizedfee = None
+    if interest is not None:
+        amortizedfee = eirinterest - np.atleast_2d(np.asarray(interest, dtype=np.float64))
+    return Amortization(eir, converged, eirinterest, eirprincipal, eirrunningbalance, amortizedfee)
+
+
+def amortize_schedule(schedule, upfrontfee, eir=None):
+    # eir columns for a PortfolioSchedule, with the fee netted off the original amount
+    originalamount = schedule.running_balance[:, 0] if schedule.num_periods else np.zeros(len(schedule))
+    upfrontfee = np.asarray(upfrontfee, dtype=np.float64)
+    amortization = amortize(schedule.total_payment, originalamount - upfrontfee, interest=schedule.interest, eir=eir)
+    if instrument.enabled():
+        instrument.count('eir.unreconciled', int(np.count_nonzero(fee_residual(schedule, amortization, upfrontfee)
+                                                                  > 1e-6 * np.maximum(1, originalamount))))
+    return amortization
+
+
+def fee_residual(schedule, amortization, upfrontfee):
+    # per loan, how far the amortized fee misses the upfront fee less the contractual balance the schedule leaves
+    # after its last repayment (zero for a loan that pays off); NaN for loans without an eir
+    with np.errstate(invalid='ignore'):
+        left = np.nansum(schedule.running_balance[:, :1], axis=1) - np.nansum(schedule.principal, axis=1)
+        total = np.nansum(amortization.amortizedfee, axis=1)
+    return np.where(np.isfinite(amortization.eir), np.abs(total - (upfrontfee - left)), np.nan)
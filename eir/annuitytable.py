@@ -0,0 +1,123 @@
+# precomputed annuity factors over a grid of periodic rates and terms
+# factors[n, i] is (1 - (1 + r) ** -n) / r at r = i * rate_step for n = 0..max_n repayments, and rates[n, j] the
+# inverse: the rate whose factor is n * j * ratio_step, so a level-annuity eir is read off with one interpolation
+# instead of newton iterations; eirsolver uses it to seed its solve (see seed_table), so results keep the
+# solver's precision
+#
+# a table is saved as one .npz file and only read on its first lookup; its accuracy against the exact factors
+# is measured when it is built (validate) and kept with it
+import numpy as np
+
+_arrays = ('factors', 'rates', 'grid', 'bounds')
+
+
+class AnnuityTable:
+    def __init__(self, path=None, arrays=None):
+        # either the path of a saved table, read on first use, or the arrays of a new one
+        self.path = path
+        self._arrays = arrays
+
+    def _get(self, name):
+        if self._arrays is None:
+            with np.load(self.path) as saved:
+                self._arrays = {key: saved[key] for key in _arrays}
+        return self._arrays[name]
+
+    @property
+    def rate_step(self):
+        return float(self._get('grid')[0])
+
+    @property
+    def ratio_step(self):
+        return float(self._get('grid')[1])
+
+    @property
+    def max_n(self):
+        return self._get('factors').shape[0] - 1
+
+    @property
+    def max_rate(self):
+        return self.rate_step * (self._get('factors').shape[1] - 1)
+
+    @property
+    def bounds(self):
+        # largest relative error of an interpolated factor and absolute error of an interpolated rate, as
+        # measured by validate when the table was built
+        factor_error, rate_error = self._get('bounds')
+        return {'factor': float(factor_error), 'rate': float(rate_error)}
+
+    def factor(self, rate, n):
+        # interpolated annuity factors, NaN outside the table
+        rate, n = np.broadcast_arrays(np.asarray(rate, dtype=np.float64), np.asarray(n))
+        return _interpolate(self._get('factors'), rate / self.rate_step, n, self.max_n)
+
+    def installment(self, balance, rate, n):
+        # emi paying off balance in n repayments at the periodic rate
+        return np.asarray(balance, dtype=np.float64) / self.factor(rate, n)
+
+    def rate(self, target, n):
+        # periodic rate at which n level repayments of 1 are worth target, NaN outside the table
+        target, n = np.broadcast_arrays(np.asarray(target, dtype=np.float64), np.asarray(n))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = target / n
+        return _interpolate(self._get('rates'), ratio / self.ratio_step, n, self.max_n)
+
+    def save(self, path):
+        np.savez(path, **{name: self._get(name) for name in _arrays})
+        self.path = path
+
+
+def _interpolate(values, position, n, max_n):
+    # linear interpolation along the rows of values at fractional column positions, row n; NaN where the position
+    # or n fall outside the table
+    inside = (position >= 0) & (position <= values.shape[1] - 1) & (n >= 1) & (n <= max_n)
+    position = np.where(inside, position, 0.0)
+    row = np.where(inside, n, 0).astype(np.int64)
+    column = np.minimum(position.astype(np.int64), values.shape[1] - 2)
+    weight = position - column
+    result = values[row, column] * (1 - weight) + values[row, column + 1] * weight
+    return np.where(inside, result, np.nan)
+
+
+def build_table(max_rate=0.05, rate_step=1e-4, max_n=480, ratio_step=1e-3):
+    # rates from 0 to max_rate per period, 1 to max_n repayments; the inverse covers factor / n from its value
+    # at max_rate up to 1 (a zero rate)
+    from .eirsolver import annuity_factor
+
+    grid_rates = np.arange(int(round(max_rate / rate_step)) + 1) * rate_step
+    terms = np.arange(max_n + 1, dtype=np.float64)
+    factors, _ = annuity_factor(grid_rates[None, :], terms[:, None])
+
+    ratios = np.arange(int(round(1 / ratio_step)) + 1) * ratio_step
+    rates = np.full((max_n + 1, len(ratios)), np.nan)
+    fine_rates = np.linspace(0, max_rate, 16 * (len(grid_rates) - 1) + 1)
+    for n in range(1, max_n + 1):
+        # the factor falls as the rate rises, so the inverse interpolates over the reversed fine grid
+        fine_ratios = annuity_factor(fine_rates, n)[0][::-1] / n
+        covered = ratios >= fine_ratios[0]
+        rates[n, covered] = np.interp(ratios[covered], fine_ratios, fine_rates[::-1])
+
+    table = AnnuityTable(arrays={'factors': factors, 'rates': rates, 'grid': np.array([rate_step, ratio_step]),
+                                 'bounds': np.zeros(2)})
+    table._arrays['bounds'] = np.array(validate(table))
+    return table
+
+
+def validate(table, samples=200000, seed=0):
+    # largest relative factor error and absolute rate error of the table at random rates and terms, against
+    # the exact annuity factor and the newton solution
+    from .eirsolver import annuity_factor, solve_eir
+
+    generator = np.random.default_rng(seed)
+    n = generator.integers(1, table.max_n + 1, samples)
+    rate = generator.uniform(0, table.max_rate, samples)
+    exact = annuity_factor(rate, n)[0]
+    factor_error = np.nanmax(np.abs(table.factor(rate, n) / exact - 1))
+    interpolated = table.rate(exact, n)
+    solved = solve_eir(1.0, n, exact).rate
+    rate_error = np.nanmax(np.abs(interpolated - solved))
+    return float(factor_error), float(rate_error)
+
+
+def load_table(path):
+    return AnnuityTable(path)
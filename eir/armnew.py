@@ -1,14 +1,14 @@
-import pandas as pd
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-from scipy.optimize import brentq as root
 
-def eirfunc(installment_amount, num_of_pmts, presVal):
-    return root(lambda x: installment_amount * ((1 - ((1 + x) ** (-num_of_pmts))) / x) - presVal, 0.000001, 0.999999) * 100 * 12
 
 def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount, repaymentfrequency,
                                      interestrate, upfrontfee, repaymenttype, interest_calculation_method,
                                      base_days, interest_type):
+    # heavy libraries are only loaded when a schedule is generated
+    import pandas as pd
+    from .amortization import amortize
+    
     # Convert date strings to datetime objects
     loanstartdate = datetime.strptime(loanstartdate, '%Y-%m-%d')
     loanenddate = datetime.strptime(loanenddate, '%Y-%m-%d')
@@ -83,22 +83,12 @@ def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount,
             principal_payment = principal_per_installment
         total_payment = interest_payment + principal_payment + amortized_upfront_fee
         
-        eir= eirfunc(total_payment_per_installment, num_repayments, running_balance-upfrontfee)
-        eirepayment = eirfunc(total_payment_per_installment, num_repayments, running_balance)
-        eirprincipal = principal_payment / total_payment * eirepayment
-        eirinterest = interest_payment / total_payment * eirepayment
-        
         repayment_schedule.append({
             'Date': current_date,
             'Principal': principal_payment,
             'Interest': interest_payment,
             'Total Payment': total_payment,
             'Running Balance': running_balance,
-            'eirepayment': eirepayment,
-            'eirprincipal': eirprincipal,
-            'eirinterest': eirinterest,
-            'eirrunningbalance': running_balance,
-            'amortizedfee': amortized_upfront_fee,
         })
         
         running_balance -= principal_payment
@@ -106,24 +96,43 @@ def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount,
     
     repayment_schedule_df = pd.DataFrame(repayment_schedule)
     
+    # eir columns: solve the eir once on the installments against the amount net of the fee, then rebuild the
+    # carrying amount back from the last repayment by discounting at it; the first period takes up any gap between
+    # the amount net of the fee and the discounted installments
+    eirepayment = repayment_schedule_df['Principal'] + repayment_schedule_df['Interest']
+    amortization = amortize(eirepayment.values, originalamount - upfrontfee,
+                            interest=repayment_schedule_df['Interest'].values)
+    repayment_schedule_df['eir'] = amortization.eir[0] * 100 * (12 // repayment_interval)
+    repayment_schedule_df['eirepayment'] = eirepayment
+    repayment_schedule_df['eirprincipal'] = amortization.eirprincipal[0]
+    repayment_schedule_df['eirinterest'] = amortization.eirinterest[0]
+    repayment_schedule_df['eirrunningbalance'] = amortization.eirrunningbalance[0]
+    repayment_schedule_df['amortizedfee'] = amortization.amortizedfee[0]
+    
     return repayment_schedule_df
 
+
 # Example usage and print statements
-loanstartdate = '2023-01-31'
-loanenddate = '2025-01-31'
-originalamount = -10000
-repaymentfrequency = 'monthly'
-interestrate = 5
-upfrontfee = 200
-repaymenttype = 'emi'
-interest_calculation_method = 'monthly'
-base_days = 365
-interest_type = 'variable'
+def main():
+    loanstartdate = '2023-01-31'
+    loanenddate = '2025-01-31'
+    originalamount = -10000
+    repaymentfrequency = 'monthly'
+    interestrate = 5
+    upfrontfee = 200
+    repaymenttype = 'emi'
+    interest_calculation_method = 'monthly'
+    base_days = 365
+    interest_type = 'variable'
+
+    repayment_schedule_df = generate_loan_repayment_schedule(
+        loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
+        interest_calculation_method, base_days, interest_type
+    )
+    print(repayment_schedule_df[['Principal', 'Interest', 'Total Payment', 'eirepayment', 'eirprincipal', 'eirinterest', 'eirrunningbalance', 'amortizedfee']].sum())
+    print(repayment_schedule_df)
+    repayment_schedule_df.to_csv('schedule.csv')
+
 
-repayment_schedule_df = generate_loan_repayment_schedule(
-    loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
-    interest_calculation_method, base_days, interest_type
-)
-print(repayment_schedule_df[['Principal', 'Interest', 'Total Payment', 'eirepayment', 'eirprincipal', 'eirinterest', 'eirrunningbalance', 'amortizedfee']].sum())
-print(repayment_schedule_df)
-repayment_schedule_df.to_csv('schedule.csv')
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,15 @@
-import pandas as pd
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import numpy_financial as npf
-from scipy.optimize import brentq as root
 
-def eirfunc(installment_amount,num_of_pmts,presVal):
-    return root(lambda x:  installment_amount * ((1 - ((1 + x) ** (-num_of_pmts))) / x) - presVal, 0.000001, 0.999999) * 100 * 12
 
 def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount, repaymentfrequency,
                                      interestrate, upfrontfee, repaymenttype, interest_calculation_method,
                                      base_days, interest_type):
+    # heavy libraries are only loaded when a schedule is generated
+    import pandas as pd
+    import numpy_financial as npf
+    from .eirsolver import eirfunc
+    
     # Convert date strings to datetime objects
     loanstartdate = datetime.strptime(loanstartdate, '%Y-%m-%d')
     loanenddate = datetime.strptime(loanenddate, '%Y-%m-%d')
@@ -100,22 +100,28 @@ def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount,
     repayment_schedule_df['eirschedule'] = npf.pmt(eir/100/repayment_interval,num_repayments,originalamount)
     return repayment_schedule_df
 
+
 # Example usage
-loanstartdate = '2023-01-31'
-loanenddate = '2025-01-31'
-originalamount = 10000
-repaymentfrequency = 'quarterly'
-interestrate = 5
-upfrontfee = 200
-repaymenttype = 'emi'
-interest_calculation_method = 'daily'
-base_days = 365
-interest_type = 'variable'
+def main():
+    loanstartdate = '2023-01-31'
+    loanenddate = '2025-01-31'
+    originalamount = 10000
+    repaymentfrequency = 'quarterly'
+    interestrate = 5
+    upfrontfee = 200
+    repaymenttype = 'emi'
+    interest_calculation_method = 'daily'
+    base_days = 365
+    interest_type = 'variable'
+
+    repayment_schedule_df = generate_loan_repayment_schedule(
+        loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
+        interest_calculation_method, base_days, interest_type
+    )
+    print(repayment_schedule_df[['Principal', 'Interest', 'Total Payment']].sum())
+    print(repayment_schedule_df)
+    # repayment_schedule_df.to_csv('rep2.csv')
+
 
-repayment_schedule_df = generate_loan_repayment_schedule(
-    loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
-    interest_calculation_method, base_days, interest_type
-)
-print(repayment_schedule_df[['Principal', 'Interest', 'Total Payment']].sum())
-print(repayment_schedule_df)
-# repayment_schedule_df.to_csv('rep2.csv')
+if __name__ == '__main__':
+    main()
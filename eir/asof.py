@@ -0,0 +1,232 @@
+# point-in-time queries: balance, interest paid, carrying amount and unamortized fee of every loan as at a date or
+# after a number of repayments, without building the periods before it
+#
+# with monthly or flat-rate interest every loan's schedule has a closed form: an fpi loan repays the same principal
+# each period, a flat-rate loan pays the same interest, and a monthly emi balance is an annuity,
+#   balance after k repayments = (1 + g) ** k * amount - emi * ((1 + g) ** k - 1) / g    (g the periodic rate)
+# so its cash flows are level or (fpi with monthly interest) fall by the same amount each period; the carrying
+# amount after k repayments is the rest of the cash flows discounted at the periodic eir e,
+#   sum over j > k of cash flow j * (1 + e) ** (k - j)
+# a geometric and an arithmetic-geometric series, the carrying amount amortization.amortize rebuilds backward from
+# the last repayment. The fee still to amortize is what separates the two balances, balance - carrying amount, since
+# both start fee apart and the difference falls by the fee amortized each period
+#
+# daily interest depends on the days in every period, and a loan floating on a curve (given a curve, the loans with a
+# margin) on the fixings along it, neither of which has a closed form; those loans (usually a small part of a tape)
+# go through the batch engine
+from collections import namedtuple
+
+import numpy as np
+
+from .eirsolver import solve_cashflow_eir, solve_eir
+from .schedule import _installment, loan_columns, optional_columns, parse_loan_terms
+
+# per loan: period is the number of repayments made, balance the contractual balance after them, interest the
+# contractual interest paid in them, carrying the amortized cost and unamortizedfee the fee still to be recognised
+AsOf = namedtuple('AsOf', ['period', 'balance', 'interest', 'carrying', 'unamortizedfee'])
+
+# payment dates of a carry roll are clipped to the shortest month seen so far; within 48 steps of any repayment
+# interval every month length the loan will ever meet (a non-leap february included) has come round
+_carry_steps = 48
+
+
+def _geometric(rate, k):
+    # sum of (1 + rate) ** m for m = 0 .. k - 1
+    growth = np.expm1(k * np.log1p(rate))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(rate == 0, k, growth / np.where(rate == 0, 1.0, rate))
+
+
+def _weighted_geometric(rate, k):
+    # sum of m * (1 + rate) ** m for m = 0 .. k - 1, as (1 + rate) * (k * (1 + rate) ** (k - 1) - geometric) / rate;
+    # the difference loses about 2e-16 / (k * rate) of its precision, so small k * rate take the series in rate
+    x = 1 + rate
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        closed = x * (k * np.exp((k - 1) * np.log1p(rate)) - _geometric(rate, k)) / rate
+    s1 = k * (k - 1) / 2
+    s2 = (k - 1) * k * (2 * k - 1) / 6
+    s3 = s1 ** 2
+    series = s1 + rate * s2 + rate ** 2 * (s3 - s2) / 2
+    return np.where(np.abs(k * rate) < 1e-4, series, closed)
+
+
+def payment_count(loanstartdate, repayment_interval, num_repayments, asof, roll='carry'):
+    # repayments falling on or before asof (a date, or one per loan), from the month arithmetic of the payment
+    # calendar: repayment j falls in the month j intervals after the start, on the start day clipped by the roll
+    start = np.asarray(loanstartdate, dtype='datetime64[D]')
+    interval = np.asarray(repayment_interval, dtype=np.int64)
+    asof = np.broadcast_to(np.asarray(asof, dtype='datetime64[D]'), start.shape)
+    start_month = start.astype('datetime64[M]')
+    start_day = (start - start_month.astype('datetime64[D]')).astype(np.int64) + 1
+    # the last repayment in or before the as-of month, which may still fall after the as-of day
+    months = (asof.astype('datetime64[M]') - start_month).astype(np.int64)
+    count = np.clip(months // interval, 0, num_repayments)
+    month = start_month + (count * interval).astype('timedelta64[M]')
+    month_days = ((month + 1).astype('datetime64[D]') - month.astype('datetime64[D]')).astype(np.int64)
+    if roll == 'carry':
+        steps = np.arange(1, _carry_steps + 1)
+        seen = start_month[:, None] + (steps * interval[:, None]).astype('timedelta64[M]')
+        seen_days = ((seen + 1).astype('datetime64[D]') - seen.astype('datetime64[D]')).astype(np.int64)
+        shortest = np.minimum.accumulate(np.minimum(start_day[:, None], seen_days), axis=1)
+        day = shortest[np.arange(len(start)), np.clip(count, 1, _carry_steps) - 1]
+    elif roll == 'eom':
+        month_end = start_day == ((start_month + 1).astype('datetime64[D]')
+                                  - start_month.astype('datetime64[D]')).astype(np.int64)
+        day = np.minimum(np.where(month_end, 31, start_day), month_days)
+    else:
+        raise ValueError("Invalid date roll")
+    date = month.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    return np.where((count > 0) & (date > asof), count - 1, count)
+
+
+def _closed_form(terms, upfrontfee):
+    # per-loan cash flow of repayment j, alpha + beta * j, for the loans with a closed form
+    amount = terms.originalamount
+    n = terms.num_repayments
+    with np.errstate(divide='ignore', invalid='ignore'):
+        principal_per_installment = amount / n
+    installment = _installment(amount, terms.interest_rate_factor, n)
+    periodic = terms.interestrate / 100 / 12 * terms.repayment_interval
+    flat_interest = terms.interestrate / 100 * amount
+    fpi = ~terms.emi
+    alpha = np.where(fpi, principal_per_installment + np.where(terms.flatrate, flat_interest,
+                                                                periodic * (amount + principal_per_installment)),
+                     installment)
+    beta = np.where(fpi & ~terms.flatrate, -periodic * principal_per_installment, 0.0)
+    return alpha, beta, periodic, principal_per_installment, installment, flat_interest
+
+
+def _closed_form_eir(terms, upfrontfee):
+    # periodic eir per loan against amount less fee: level cash flows through the annuity solve, falling fpi flows
+    # from their closed form; NaN for daily-interest loans
+    carrying_amount = terms.originalamount - upfrontfee
+    alpha, beta, _, _, _, _ = _closed_form(terms, upfrontfee)
+    eir = np.full(len(upfrontfee), np.nan)
+    level = (terms.monthly & (beta == 0)) | terms.flatrate
+    if level.any():
+        eir[level] = solve_eir(alpha[level], terms.num_repayments[level], carrying_amount[level]).rate
+    falling = ~level & terms.monthly
+    if falling.any():
+        n = terms.num_repayments[falling]
+        steps = np.arange(1, int(n.max()) + 1)
+        with np.errstate(invalid='ignore'):
+            cashflows = np.where(steps <= n[:, None], alpha[falling, None] + beta[falling, None] * steps, np.nan)
+        eir[falling] = solve_cashflow_eir(cashflows, carrying_amount[falling]).rate
+    return eir
+
+
+def _by_schedule(loans, terms, curve):
+    # loans without a closed form: daily interest, and those generate_portfolio_schedule floats on the curve
+    scheduled = ~terms.monthly & ~terms.flatrate
+    if curve is not None:
+        margin = np.asarray(loans['margin'], dtype=np.float64) if 'margin' in loans else np.zeros(len(scheduled))
+        scheduled |= ~terms.flatrate & ~np.isnan(margin)
+    return scheduled
+
+
+def loan_eir(loans, roll='carry', curve=None):
+    # periodic eir per loan as the batch engine solves it, the loans without a closed form from their schedules
+    from .amortization import amortize_schedule
+    from .schedule import generate_portfolio_schedule
+
+    terms = parse_loan_terms(loans)
+    upfrontfee = np.asarray(loans['upfrontfee'], dtype=np.float64)
+    eir = _closed_form_eir(terms, upfrontfee)
+    scheduled = _by_schedule(loans, terms, curve)
+    if scheduled.any():
+        rows = np.flatnonzero(scheduled)
+        schedule = generate_portfolio_schedule(_take(loans, rows), roll, curve)
+        eir[rows] = amortize_schedule(schedule, upfrontfee[rows]).eir
+    return eir
+
+
+def _take(loans, rows):
+    return {name: np.asarray(loans[name])[rows] for name in loan_columns + optional_columns + ['margin']
+            if name in loans}
+
+
+def _from_schedule(loans, rows, k, eir, roll, curve=None):
+    # AsOf amounts of loans taken from their batch schedules, for the loans without a closed form
+    from .amortization import amortize_schedule
+    from .schedule import generate_portfolio_schedule
+
+    subset = _take(loans, rows)
+    schedule = generate_portfolio_schedule(subset, roll, curve)
+    amortization = amortize_schedule(schedule, subset['upfrontfee'], eir=eir)
+    mask = schedule.period_mask()
+
+    def paid(values):
+        # sum over the first k periods of each loan
+        total = np.concatenate([np.zeros((len(k), 1)), np.cumsum(np.where(mask, values, 0.0), axis=1)], axis=1)
+        return total[np.arange(len(k)), k]
+
+    amount = np.asarray(subset['originalamount'], dtype=np.float64)
+    carrying_amount = amount - np.asarray(subset['upfrontfee'], dtype=np.float64)
+    return (amount - paid(schedule.principal), paid(schedule.interest),
+            carrying_amount - paid(amortization.eirprincipal))
+
+
+def asof(loans, when, eir=None, roll='carry', curve=None):
+    # AsOf of every loan of a chunk of the tape; when is a date (or one per loan), counting the repayments on or
+    # before it, or an integer number of repayments (or one per loan); eir is the periodic eir per loan when already
+    # known (Amortization.eir, or the table's annual eir / 100 / repayments per year), otherwise it is solved; curve
+    # is the ratecurve.RateCurve the loans with a margin float on, as in generate_portfolio_schedule
+    terms = parse_loan_terms(loans)
+    upfrontfee = np.asarray(loans['upfrontfee'], dtype=np.float64)
+    n = terms.num_repayments
+    when = np.asarray(when)
+    if when.dtype.kind in 'iu':
+        k = np.clip(np.broadcast_to(when, n.shape).astype(np.int64), 0, n)
+    else:
+        k = payment_count(terms.loanstartdate, terms.repayment_interval, n, when, roll)
+    scheduled = _by_schedule(loans, terms, curve)
+    if eir is None:
+        # the loans without a closed form are solved with their schedules below
+        eir = _closed_form_eir(terms, upfrontfee)
+        eir[scheduled] = np.nan
+    else:
+        eir = np.broadcast_to(np.asarray(eir, dtype=np.float64), n.shape)
+
+    amount = terms.originalamount
+    alpha, beta, periodic, principal_per_installment, installment, flat_interest = _closed_form(terms, upfrontfee)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        annuity = amount * np.exp(k * np.log1p(periodic)) - installment * _geometric(periodic, k)
+        balance = np.where(terms.emi, np.where(terms.flatrate, amount - k * (installment - flat_interest), annuity),
+                           amount - k * principal_per_installment)
+        paid = k * alpha + beta * k * (k + 1) / 2
+        interest = paid - (amount - balance)
+
+        # the remaining m = n - k repayments discounted at the eir, v = 1 / (1 + eir) per period: repayment k + i
+        # is (alpha + beta * k) + beta * i, worth (alpha + beta * k) * a + beta * ia with a the sum of v ** i and ia
+        # of i * v ** i, both series in v = 1 + (v - 1)
+        m = n - k
+        v = 1 / (1 + eir)
+        a = v * _geometric(-eir * v, m)
+        ia = v * (_weighted_geometric(-eir * v, m) + a / v)
+        carrying = (alpha + beta * k) * a + beta * ia
+    # before the first repayment (also for loans without repayments, whose per-repayment amounts are not finite)
+    opening = k == 0
+    balance = np.where(opening, amount, balance)
+    interest = np.where(opening, 0.0, interest)
+    carrying = np.where(opening, amount - upfrontfee, carrying)
+
+    if scheduled.any():
+        rows = np.flatnonzero(scheduled)
+        known = eir[rows] if np.isfinite(eir[rows]).all() else None
+        balance[rows], interest[rows], carrying[rows] = _from_schedule(loans, rows, k[rows], known, roll, curve)
+    return AsOf(k, balance, interest, carrying, balance - carrying)
+
+
+def asof_tape(tape, when, chunksize=100000, roll='carry', curve=None):
+    # one row per loan: loanid and its AsOf amounts, chunk by chunk
+    import pandas as pd
+    from .pipeline import read_tape
+
+    first_row = 0
+    for chunk in read_tape(tape, chunksize):
+        result = asof(chunk, when, roll=roll, curve=curve)
+        loanid = chunk['loanid'].values if 'loanid' in chunk else np.arange(first_row, first_row + len(chunk))
+        columns = {'loanid': loanid}
+        columns.update(result._asdict())
+        first_row += len(chunk)
+        yield pd.DataFrame(columns)
@@ -0,0 +1,155 @@
+# memoized schedules and eir solutions keyed on product terms
+# schedules scale linearly with the original amount, so a unit-principal schedule is computed once per set of
+# terms and scaled per loan; the eir only depends on the terms and the fee / principal ratio
+import numpy as np
+
+from .eirsolver import solve_cashflow_eir, solve_eir
+from .lru import LRUCache
+from .paycalendar import payment_calendar
+from .schedule import PortfolioSchedule, generate_portfolio_schedule, loan_columns, optional_columns, parse_loan_terms
+
+# bytes charged per memoized eir: key tuple plus a float
+_eir_entry_bytes = 128
+
+
+def _group(keys):
+    # unique rows of a structured key array, and the loan rows belonging to each of them
+    unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(unique)))[:-1]
+    return unique, first, inverse, np.split(order, bounds)
+
+
+class ScheduleCache:
+    # max_bytes caps the unit schedules, eir_max_bytes the memoized eir solutions
+    def __init__(self, max_bytes=256 * 2 ** 20, eir_max_bytes=16 * 2 ** 20):
+        self.schedules = LRUCache(max_bytes, 'schedules')
+        self.eirs = LRUCache(eir_max_bytes, 'eirs')
+
+    def stats(self):
+        return {'schedules': self.schedules.stats(), 'eirs': self.eirs.stats()}
+
+    def _signatures(self, terms, roll):
+        # everything a unit-principal schedule depends on; the start date, day count and date roll
+        # only matter for daily interest
+        keys = np.empty(len(terms.originalamount), dtype=[
+            ('repayment_interval', 'i8'), ('num_repayments', 'i8'), ('interestrate', 'f8'), ('emi', '?'),
+            ('monthly', '?'), ('base_days', 'f8'), ('flatrate', '?'), ('loanstartdate', 'i8'),
+            ('daycount', 'U7'), ('roll', 'U5')])
+        keys['repayment_interval'] = terms.repayment_interval
+        keys['num_repayments'] = terms.num_repayments
+        keys['interestrate'] = terms.interestrate
+        keys['emi'] = terms.emi
+        keys['monthly'] = terms.monthly
+        keys['base_days'] = np.where(terms.monthly, 0, terms.base_days)
+        keys['flatrate'] = terms.flatrate
+        keys['loanstartdate'] = np.where(terms.monthly, 0, terms.loanstartdate.astype(np.int64))
+        keys['daycount'] = np.where(terms.monthly, '', terms.daycount)
+        keys['roll'] = np.where(terms.monthly, '', roll)
+        return keys
+
+    def _unit_schedules(self, loans, terms, roll, record=True):
+        # unit schedules for every distinct signature, computing the missing ones in one batch
+        unique, first, inverse, groups = _group(self._signatures(terms, roll))
+        units = [self.schedules.get(key, record) for key in unique.tolist()]
+        missing = [i for i, unit in enumerate(units) if unit is None]
+        if missing:
+            rows = first[missing]
+            tape = {name: np.asarray(loans[name])[rows] for name in loan_columns + optional_columns
+                    if name in loans}
+            tape['originalamount'] = np.ones(len(rows))
+            computed = generate_portfolio_schedule(tape, roll)
+            for j, i in enumerate(missing):
+                n = computed.num_repayments[j]
+                unit = tuple(np.ascontiguousarray(values[j, :n]) for values in
+                             (computed.principal, computed.interest, computed.total_payment,
+                              computed.running_balance)) + (computed.installment[j],)
+                self.schedules.put(unique[i].tolist(), unit, sum(values.nbytes for values in unit[:4]))
+                units[i] = unit
+        return units, inverse, groups
+
+    def schedule(self, loans, roll='carry'):
+        # same as generate_portfolio_schedule(loans, roll), scaled from the cached unit schedules
+        terms = parse_loan_terms(loans)
+        units, inverse, groups = self._unit_schedules(loans, terms, roll)
+        num_periods = int(terms.num_repayments.max()) if len(terms.num_repayments) else 0
+        shape = (len(terms.originalamount), num_periods)
+        arrays = [np.full(shape, np.nan) for _ in range(4)]
+        installment = np.empty(shape[0])
+        for unit, rows in zip(units, groups):
+            n = len(unit[0])
+            amount = terms.originalamount[rows, None]
+            for values, unit_values in zip(arrays, unit):
+                values[rows, :n] = unit_values * amount
+            installment[rows] = unit[4] * terms.originalamount[rows]
+
+        calendar = payment_calendar(terms.loanstartdate, terms.repayment_interval, terms.num_repayments,
+                                    terms.daycount, roll)
+        principal, interest, total_payment, running_balance = arrays
+        return PortfolioSchedule(calendar.dates, principal, interest, total_payment, running_balance,
+                                 terms.num_repayments, terms.repayment_interval, installment, calendar.days)
+
+    def eir(self, loans, roll='carry'):
+        # periodic eir per loan, memoized on (signature, fee / principal); the unit schedule lookups
+        # are not counted again when schedule() was called for the same loans
+        terms = parse_loan_terms(loans)
+        units, inverse, _ = self._unit_schedules(loans, terms, roll, record=False)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fee_ratio = np.asarray(loans['upfrontfee'], dtype=np.float64) / terms.originalamount
+        keys = np.empty(len(fee_ratio), dtype=[('signature', 'i8'), ('fee_ratio', 'f8')])
+        keys['signature'] = inverse
+        keys['fee_ratio'] = fee_ratio
+        unique, first, key_inverse, _ = _group(keys)
+
+        signatures = self._signatures(terms, roll)
+        rates = np.empty(len(unique))
+        missing = []
+        for i, (signature, ratio) in enumerate(unique.tolist()):
+            rate = self.eirs.get((signatures[first[i]].tolist(), ratio))
+            if rate is None:
+                missing.append(i)
+            else:
+                rates[i] = rate
+        if missing:
+            num_periods = max(len(units[unique['signature'][i]][2]) for i in missing)
+            cashflows = np.full((len(missing), num_periods), np.nan)
+            for j, i in enumerate(missing):
+                flows = units[unique['signature'][i]][2]
+                cashflows[j, :len(flows)] = flows
+            solved = solve_cashflow_eir(cashflows, 1 - unique['fee_ratio'][missing]).rate
+            for j, i in enumerate(missing):
+                rates[i] = solved[j]
+                self.eirs.put((signatures[first[i]].tolist(), unique['fee_ratio'][i]), solved[j],
+                              _eir_entry_bytes)
+        return rates[key_inverse]
+
+    def eirfunc(self, installment_amount, num_of_pmts, presVal):
+        # eirsolver.eirfunc memoized on (n, presVal / installment)
+        installment_amount, num_of_pmts, presVal = np.broadcast_arrays(
+            np.asarray(installment_amount, dtype=np.float64), np.asarray(num_of_pmts, dtype=np.float64),
+            np.asarray(presVal, dtype=np.float64))
+        shape = installment_amount.shape
+        keys = np.empty(installment_amount.size, dtype=[('n', 'f8'), ('ratio', 'f8')])
+        keys['n'] = num_of_pmts.ravel()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            keys['ratio'] = presVal.ravel() / installment_amount.ravel()
+        unique, _, inverse, _ = _group(keys)
+
+        rates = np.empty(len(unique))
+        missing = []
+        for i, key in enumerate(unique.tolist()):
+            rate = self.eirs.get(key)
+            if rate is None:
+                missing.append(i)
+            else:
+                rates[i] = rate
+        if missing:
+            solved = solve_eir(1.0, unique['n'][missing], unique['ratio'][missing]).rate
+            rates[missing] = solved
+            for i, rate in zip(missing, solved):
+                self.eirs.put(unique[i].tolist(), rate, _eir_entry_bytes)
+        eir = (rates[inverse] * 100 * 12).reshape(shape)
+        if eir.ndim == 0:
+            return float(eir)
+        return eir
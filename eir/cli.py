@@ -0,0 +1,289 @@
+# command line entry point: eir run loans.csv -o schedule.csv, eir report loans.csv --by product,
+# eir serve --port 8765, eir store schedule.csv store/, eir shock loans.csv --asof 2024-12-31,
+# eir delta loans.csv store/, eir annuity-table table.npz, eir asof loans.csv --date 2024-12-31,
+# eir ladder loans.csv --asof 2024-12-31
+import argparse
+import sys
+
+
+def _seed_table(path):
+    from .annuitytable import load_table
+    from .eirsolver import seed_table
+    seed_table(load_table(path))
+
+
+def _cache_bytes(args):
+    return None if args.cache_mb is None else int(args.cache_mb * 2 ** 20)
+
+
+def _curve(args):
+    if args.curve is None:
+        return None
+    from .ratecurve import read_curve
+    return read_curve(args.curve)
+
+
+def run(args):
+    from . import instrument
+    from .pipeline import print_progress, process_chunk, read_tape, run_pipeline
+
+    if args.stats is not None:
+        instrument.enable()
+    if args.annuity_table is not None:
+        _seed_table(args.annuity_table)
+    cache_bytes = _cache_bytes(args)
+    curve = _curve(args)
+    fixed = None
+    if args.cents:
+        from .fixedpoint import FixedPoint
+        fixed = FixedPoint(100, args.rounding)
+    if args.output == '-':
+        if args.resume:
+            raise SystemExit("--resume needs an output file")
+        cache = None
+        if cache_bytes is not None:
+            from .cache import ScheduleCache
+            cache = ScheduleCache(cache_bytes)
+        first_row = 0
+        for i, chunk in enumerate(read_tape(args.tape, args.chunksize)):
+            frame = process_chunk(chunk, first_row, cache, args.roll, curve, fixed)
+            frame.to_csv(sys.stdout, index=False, header=i == 0)
+            first_row += len(chunk)
+    else:
+        stats = run_pipeline(args.tape, args.output, chunksize=args.chunksize, checkpoint=args.checkpoint,
+                             resume=args.resume, progress=None if args.quiet else print_progress,
+                             workers=args.workers, cache_bytes=cache_bytes, roll=args.roll, curve=curve,
+                             fixed=fixed, keys=args.keys)
+        print('%d loans, %d repayments in %.2fs (%.0f rows/s)' % (stats.loans, stats.rows, stats.seconds,
+                                                                stats.rows_per_second), file=sys.stderr)
+    if args.stats is not None:
+        instrument.write(instrument.disable(), args.stats)
+
+
+def report(args):
+    from .aggregate import aggregate_tape
+
+    cache_bytes = _cache_bytes(args)
+    curve = _curve(args)
+    totals = aggregate_tape(args.tape, args.by, chunksize=args.chunksize, workers=args.workers,
+                            cache_bytes=cache_bytes, roll=args.roll, curve=curve)
+    totals.to_csv(sys.stdout if args.output == '-' else args.output, index=False)
+
+
+def serve(args):
+    from .quoteserver import serve as serve_quotes
+
+    cache_bytes = _cache_bytes(args)
+    if args.annuity_table is not None:
+        _seed_table(args.annuity_table)
+    print('serving quotes on %s' % (args.unix or '%s:%d' % (args.host, args.port)), file=sys.stderr)
+    try:
+        serve_quotes(args.host, args.port, args.unix, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000,
+                     max_queue=args.max_queue, cache_bytes=cache_bytes, roll=args.roll)
+    except KeyboardInterrupt:
+        pass
+
+
+def store(args):
+    from .store import csv_to_store
+
+    schedules = csv_to_store(args.schedule, args.store, args.chunksize)
+    print('%d loans, %d repayments in %s' % (len(schedules), schedules.num_rows, args.store), file=sys.stderr)
+
+
+def ladder(args):
+    import pandas as pd
+    from .ladder import ladder_tape
+
+    cache_bytes = _cache_bytes(args)
+    curve = _curve(args)
+    book = ladder_tape(args.tape, args.by, chunksize=args.chunksize, workers=args.workers, cache_bytes=cache_bytes,
+                       roll=args.roll, curve=curve)
+    # every as-of date is laddered from the same daily totals
+    frames = []
+    for asof in args.asof:
+        frame = book.ladder(asof)
+        frame.insert(0, 'asof', asof)
+        frames.append(frame)
+    pd.concat(frames, ignore_index=True).to_csv(sys.stdout if args.output == '-' else args.output, index=False)
+
+
+def shock(args):
+    from .scenarios import shock_tape
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        for i, frame in enumerate(shock_tape(args.tape, args.asof, args.shocks, chunksize=args.chunksize,
+                                             roll=args.roll, floor=None if args.no_floor else args.floor)):
+            frame.to_csv(output, index=False, header=i == 0)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def asof(args):
+    from .asof import asof_tape
+
+    when = args.date if args.period is None else args.period
+    curve = _curve(args)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        for i, frame in enumerate(asof_tape(args.tape, when, chunksize=args.chunksize, roll=args.roll, curve=curve)):
+            frame.to_csv(output, index=False, header=i == 0)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def delta(args):
+    from .delta import delta_run, write_store_csv
+
+    cache_bytes = _cache_bytes(args)
+    curve = _curve(args)
+    stats = delta_run(args.tape, args.store, chunksize=args.chunksize, workers=args.workers,
+                      cache_bytes=cache_bytes, roll=args.roll, curve=curve)
+    print('%d loans reused, %d recomputed, %d deleted in %.2fs' % (stats.reused, stats.recomputed, stats.deleted,
+                                                                 stats.seconds), file=sys.stderr)
+    if args.output is not None:
+        write_store_csv(args.tape, args.store, args.output, args.chunksize)
+
+
+def annuity_table(args):
+    from .annuitytable import build_table
+
+    table = build_table(args.max_rate, args.rate_step, args.max_n, args.ratio_step)
+    table.save(args.table)
+    print('rates 0 to %g per period, 1 to %d repayments: factors within %.1e (relative), rates within %.1e'
+          % (table.max_rate, table.max_n, table.bounds['factor'], table.bounds['rate']), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='eir', description='loan repayment schedules with eir fee amortization')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('run', help='generate schedules and eir columns for a loan tape')
+    command.add_argument('tape', help='loan tape (csv, or parquet with pyarrow) with one row per loan')
+    command.add_argument('-o', '--output', default='-',
+                         help='output csv, or parquet (with pyarrow) for a .parquet file (default: csv to stdout)')
+    command.add_argument('--chunksize', type=int, default=100000, help='loans per chunk (default: 100000)')
+    command.add_argument('--keys', nargs='+', default=[],
+                         help='tape columns added to parquet output as dictionary-encoded keys, e.g. product')
+    command.add_argument('--checkpoint', help='checkpoint file (default: OUTPUT.checkpoint)')
+    command.add_argument('--resume', action='store_true', help='continue after the last completed chunk')
+    command.add_argument('-j', '--workers', type=int, default=1, help='worker processes (default: 1)')
+    command.add_argument('--cache-mb', type=float,
+                         help='reuse unit-principal schedules of loans with the same terms, up to this many MB')
+    command.add_argument('--roll', choices=['carry', 'eom'], default='carry',
+                         help='payment date roll: carry a clipped day forward like relativedelta (default) '
+                              'or anchor on the start day and month end')
+    command.add_argument('--curve', help='benchmark rate curve (csv with date and rate columns) for variable-rate '
+                                         'loans, which pay the fixing plus their margin column')
+    command.add_argument('--cents', action='store_true',
+                         help='compute the amounts in integer cents, so principal adds up to the original amount '
+                              'and the amortized fee to the upfront fee exactly')
+    command.add_argument('--rounding', choices=['half_even', 'half_up', 'down'], default='half_even',
+                         help='rounding of each amount to cents with --cents (default: half_even)')
+    command.add_argument('--annuity-table', help='seed the eir solver from this annuity table (eir annuity-table)')
+    command.add_argument('--stats', help='write stage timings and counters to this file (json, or the prometheus '
+                                         'text format for a .prom file)')
+    command.add_argument('-q', '--quiet', action='store_true', help='no per-chunk progress')
+    command.set_defaults(func=run)
+
+    command = commands.add_parser('report', help='month-end totals of a loan tape by segment')
+    command.add_argument('tape', help='loan tape (csv, or parquet with pyarrow) with one row per loan')
+    command.add_argument('-o', '--output', default='-', help='output csv (default: stdout)')
+    command.add_argument('--by', nargs='*', default=[], help='tape columns to break the totals down by')
+    command.add_argument('--chunksize', type=int, default=100000, help='loans per chunk (default: 100000)')
+    command.add_argument('-j', '--workers', type=int, default=1, help='worker processes (default: 1)')
+    command.add_argument('--cache-mb', type=float,
+                         help='reuse unit-principal schedules of loans with the same terms, up to this many MB')
+    command.add_argument('--roll', choices=['carry', 'eom'], default='carry', help='payment date roll')
+    command.add_argument('--curve', help='benchmark rate curve for variable-rate loans (see run)')
+    command.set_defaults(func=report)
+
+    command = commands.add_parser('serve', help='quote server pricing concurrent requests in micro-batches')
+    command.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    command.add_argument('--port', type=int, default=8765, help='port to listen on (default: 8765)')
+    command.add_argument('--unix', help='listen on this unix socket instead')
+    command.add_argument('--max-batch', type=int, default=256, help='most requests priced together (default: 256)')
+    command.add_argument('--max-wait-ms', type=float, default=2.0,
+                         help='longest a request waits for its batch to fill (default: 2)')
+    command.add_argument('--max-queue', type=int, default=4096,
+                         help='requests queued before connections are no longer read (default: 4096)')
+    command.add_argument('--cache-mb', type=float,
+                         help='reuse unit-principal schedules of loans with the same terms, up to this many MB')
+    command.add_argument('--roll', choices=['carry', 'eom'], default='carry', help='payment date roll')
+    command.add_argument('--annuity-table', help='seed the eir solver from this annuity table (eir annuity-table)')
+    command.set_defaults(func=serve)
+
+    command = commands.add_parser('store', help='append a schedule csv to a binary schedule store')
+    command.add_argument('schedule', help='schedule csv written by eir run, or by one of the scripts')
+    command.add_argument('store', help='store directory, created when missing')
+    command.add_argument('--chunksize', type=int, default=1000000, help='csv rows per chunk (default: 1000000)')
+    command.set_defaults(func=store)
+
+    command = commands.add_parser('ladder', help='contractual cash flows by time band after as-of dates')
+    command.add_argument('tape', help='loan tape (csv, or parquet with pyarrow) with one row per loan')
+    command.add_argument('--asof', nargs='+', required=True,
+                         help='as-of dates; each gets its own ladder from one pass over the tape')
+    command.add_argument('--by', nargs='*', default=[], help='tape columns to break the ladder down by')
+    command.add_argument('-o', '--output', default='-', help='output csv (default: stdout)')
+    command.add_argument('--chunksize', type=int, default=100000, help='loans per chunk (default: 100000)')
+    command.add_argument('-j', '--workers', type=int, default=1, help='worker processes (default: 1)')
+    command.add_argument('--cache-mb', type=float,
+                         help='reuse unit-principal schedules of loans with the same terms, up to this many MB')
+    command.add_argument('--roll', choices=['carry', 'eom'], default='carry', help='payment date roll')
+    command.add_argument('--curve', help='benchmark rate curve for variable-rate loans (see run)')
+    command.set_defaults(func=ladder)
+
+    command = commands.add_parser('shock', help='eir, amortized fee and carrying amount under rate shocks')
+    command.add_argument('tape', help='loan tape (csv, or parquet with pyarrow) with one row per loan')
+    command.add_argument('--asof', required=True, help='reporting date for the amortized fee and carrying amount')
+    command.add_argument('--shocks', type=float, nargs='+', default=[-200, -100, -50, 0, 50, 100, 200],
+                         help='parallel shocks of the variable rates in basis points (default: -200 to 200)')
+    command.add_argument('--floor', type=float, default=0.0, help='lowest shocked rate in percent (default: 0)')
+    command.add_argument('--no-floor', action='store_true', help='let shocked rates go below the floor')
+    command.add_argument('-o', '--output', default='-', help='output csv (default: stdout)')
+    command.add_argument('--chunksize', type=int, default=5000, help='loans per chunk (default: 5000)')
+    command.add_argument('--roll', choices=['carry', 'eom'], default='carry', help='payment date roll')
+    command.set_defaults(func=shock)
+
+    command = commands.add_parser('asof', help='balance, interest paid, carrying amount and unamortized fee of every '
+                                               'loan at a date')
+    command.add_argument('tape', help='loan tape (csv, or parquet with pyarrow) with one row per loan')
+    when = command.add_mutually_exclusive_group(required=True)
+    when.add_argument('--date', help='as-of date; repayments falling on it count as made')
+    when.add_argument('--period', type=int, help='number of repayments made, for every loan')
+    command.add_argument('-o', '--output', default='-', help='output csv (default: stdout)')
+    command.add_argument('--chunksize', type=int, default=100000, help='loans per chunk (default: 100000)')
+    command.add_argument('--roll', choices=['carry', 'eom'], default='carry', help='payment date roll')
+    command.add_argument('--curve', help='benchmark rate curve for variable-rate loans (see run)')
+    command.set_defaults(func=asof)
+
+    command = commands.add_parser('delta', help='bring a schedule store up to date with a new tape snapshot, '
+                                                'computing only new and changed loans')
+    command.add_argument('tape', help='loan tape (csv, or parquet with pyarrow) with a loanid column')
+    command.add_argument('store', help='store directory of the previous run, created when missing')
+    command.add_argument('-o', '--output', help='also write the schedules of the tape to this csv (or .parquet)')
+    command.add_argument('--chunksize', type=int, default=100000, help='loans per chunk (default: 100000)')
+    command.add_argument('-j', '--workers', type=int, default=1, help='worker processes (default: 1)')
+    command.add_argument('--cache-mb', type=float,
+                         help='reuse unit-principal schedules of loans with the same terms, up to this many MB')
+    command.add_argument('--roll', choices=['carry', 'eom'], default='carry', help='payment date roll')
+    command.add_argument('--curve', help='benchmark rate curve for variable-rate loans (see run)')
+    command.set_defaults(func=delta)
+
+    command = commands.add_parser('annuity-table', help='precompute annuity factors for seeding the eir solver')
+    command.add_argument('table', help='table file to write (.npz)')
+    command.add_argument('--max-rate', type=float, default=0.05, help='highest periodic rate (default: 0.05)')
+    command.add_argument('--rate-step', type=float, default=1e-4, help='rate grid step (default: 0.0001)')
+    command.add_argument('--max-n', type=int, default=480, help='most repayments (default: 480)')
+    command.add_argument('--ratio-step', type=float, default=1e-3,
+                         help='grid step of the inverse, in factor / repayments (default: 0.001)')
+    command.set_defaults(func=annuity_table)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    args.func(args)
+    return 0
@@ -0,0 +1,101 @@
+# delta runs between loan tape snapshots
+# every loan's terms (the loan_columns, which include the fee, plus daycount and margin when the tape has them) are
+# hashed into a 64-bit fingerprint together with the payment date roll and the rate curve of the run; the schedule
+# store of the previous run keeps the fingerprint of each loan, so only loans that are new or whose fingerprint
+# changed are computed and appended, and loans no longer on the tape are removed from the store
+import hashlib
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# loans counted over the whole tape; deleted are the store's loans that are not on it any more
+DeltaStats = namedtuple('DeltaStats', ['reused', 'recomputed', 'deleted', 'seconds'])
+
+
+def _settings(roll, curve):
+    # run settings that change every schedule
+    digest = hashlib.sha1(roll.encode())
+    if curve is not None:
+        digest.update(np.ascontiguousarray(curve.dates, dtype='<M8[D]').tobytes())
+        digest.update(np.ascontiguousarray(curve.rates, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def loan_fingerprints(loans, roll='carry', curve=None):
+    # uint64 fingerprint per loan of a chunk of the tape; terms are normalised first (dates, labels, float
+    # amounts), so the same loan read with other column dtypes keeps its fingerprint
+    import pandas as pd
+    from .runner import tape_columns
+
+    columns = tape_columns(loans)
+    columns.pop('loanid', None)
+    frame = pd.DataFrame({name: columns[name] for name in sorted(columns)})
+    frame['settings'] = _settings(roll, curve)
+    return pd.util.hash_pandas_object(frame, index=False).values
+
+
+def delta_run(tape, store_path, chunksize=100000, workers=1, cache_bytes=None, roll='carry', curve=None):
+    # brings the schedule store at store_path in line with the tape, computing only new and changed loans
+    from .pipeline import read_tape
+    from .runner import map_labelled_shards
+    from .store import ScheduleStore
+
+    started = time.perf_counter()
+    store = ScheduleStore(store_path, 'a')
+    loanids = []
+    counts = {'reused': 0, 'recomputed': 0}
+
+    def changed_loans():
+        # the new and changed loans of each chunk, with their fingerprints
+        for chunk in read_tape(tape, chunksize):
+            if 'loanid' not in chunk:
+                raise ValueError("Delta runs need a loanid column on the tape")
+            ids = np.asarray(chunk['loanid']).astype(str)
+            loanids.append(ids)
+            fingerprint = loan_fingerprints(chunk, roll, curve)
+            positions = store.positions(ids)
+            reused = positions >= 0
+            reused[reused] = store.fingerprints[positions[reused]] == fingerprint[reused]
+            counts['reused'] += int(reused.sum())
+            counts['recomputed'] += int((~reused).sum())
+            if not reused.all():
+                yield chunk[~reused], fingerprint[~reused]
+
+    for result, fingerprints in map_labelled_shards(changed_loans(), workers, cache_bytes=cache_bytes, roll=roll,
+                                                    curve=curve):
+        store.append(result.table, fingerprints)
+
+    if loanids:
+        on_tape = np.concatenate(loanids)
+    else:
+        on_tape = np.zeros(0, dtype=str)
+    stored = store.live_loanids()
+    deleted = store.remove(stored[~np.isin(stored, on_tape)])
+    return DeltaStats(counts['reused'], counts['recomputed'], deleted, time.perf_counter() - started)
+
+
+def write_store_csv(tape, store_path, output, chunksize=100000):
+    # the schedules of the tape's loans from the store, in tape order and in the csv layout of the pipeline
+    # (a parquet file for an output ending in .parquet)
+    from .pipeline import read_tape
+    from .store import ScheduleStore
+
+    store = ScheduleStore(store_path)
+
+    def tables():
+        for chunk in read_tape(tape, chunksize):
+            positions = store.positions(chunk['loanid'].values)
+            if (positions < 0).any():
+                raise KeyError("Loan %s is not in the store" % chunk['loanid'].values[positions < 0][0])
+            yield store.take(positions)
+
+    if output.endswith('.parquet'):
+        from .parquetout import ParquetScheduleWriter
+        with ParquetScheduleWriter(output) as writer:
+            for table in tables():
+                writer.append(table)
+        return
+    with open(output, 'w', newline='') as out:
+        for i, table in enumerate(tables()):
+            table.to_pandas().to_csv(out, index=False, header=i == 0)
@@ -1,8 +1,10 @@
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import pandas as pd
 
 def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype, interest_calculation_method, base_days, interest_type):
+    # heavy libraries are only loaded when a schedule is generated
+    import pandas as pd
+    
     # Convert date strings to datetime objects
     loanstartdate = datetime.strptime(loanstartdate, '%Y-%m-%d')
     loanenddate = datetime.strptime(loanenddate, '%Y-%m-%d')
@@ -80,20 +82,26 @@ def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount,
     
     return pd.DataFrame(repayment_schedule)
 
+
 # Example usage
-loanstartdate = '2023-09-01'
-loanenddate = '2024-09-01'
-originalamount = 10000
-repaymentfrequency = 'monthly'  # Change to your desired frequency
-interestrate = 5  # 5%
-upfrontfee = 200
-repaymenttype = 'emi'  # Change to 'emi' for Equal Monthly Installment
-interest_calculation_method = 'daily'  # Change to 'daily' for daily interest calculation
-base_days = 365  # Change to 360 if using 360 days per year
-interest_type = 'flatrate'  # Change to 'variable' for variable interest based on running balance
+def main():
+    loanstartdate = '2023-09-01'
+    loanenddate = '2024-09-01'
+    originalamount = 10000
+    repaymentfrequency = 'monthly'  # Change to your desired frequency
+    interestrate = 5  # 5%
+    upfrontfee = 200
+    repaymenttype = 'emi'  # Change to 'emi' for Equal Monthly Installment
+    interest_calculation_method = 'daily'  # Change to 'daily' for daily interest calculation
+    base_days = 365  # Change to 360 if using 360 days per year
+    interest_type = 'flatrate'  # Change to 'variable' for variable interest based on running balance
+
+    repayment_schedule_df = generate_loan_repayment_schedule(
+        loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
+        interest_calculation_method, base_days, interest_type
+    )
+    print(repayment_schedule_df)
+
 
-repayment_schedule_df = generate_loan_repayment_schedule(
-    loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
-    interest_calculation_method, base_days, interest_type
-)
-print(repayment_schedule_df)
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,10 @@
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import pandas as pd
 
 def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype):
+    # heavy libraries are only loaded when a schedule is generated
+    import pandas as pd
+    
     # Convert date strings to datetime objects
     loanstartdate = datetime.strptime(loanstartdate, '%Y-%m-%d')
     loanenddate = datetime.strptime(loanenddate, '%Y-%m-%d')
@@ -63,14 +65,20 @@ def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount,
     
     return pd.DataFrame(repayment_schedule)
 
+
 # Example usage
-loanstartdate = '2023-09-01'
-loanenddate = '2024-09-01'
-originalamount = 10000
-repaymentfrequency = 'termly'  # Change to your desired frequency
-interestrate = 5  # 5%
-upfrontfee = 200
-repaymenttype = 'fpi'  # Change to 'emi' for Equal Monthly Installment
+def main():
+    loanstartdate = '2023-09-01'
+    loanenddate = '2024-09-01'
+    originalamount = 10000
+    repaymentfrequency = 'termly'  # Change to your desired frequency
+    interestrate = 5  # 5%
+    upfrontfee = 200
+    repaymenttype = 'fpi'  # Change to 'emi' for Equal Monthly Installment
+
+    repayment_schedule_df = generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype)
+    print(repayment_schedule_df)
+
 
-repayment_schedule_df = generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype)
-print(repayment_schedule_df)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# vectorized effective interest rate solver
+# solves the annuity equation installment * (1 - (1 + x) ** -n) / x = presVal for whole arrays of loans
+# with newton steps on the analytic derivative, in place of one brentq call per loan
+from collections import namedtuple
+
+import numpy as np
+
+from . import instrument
+
+# rate is the periodic rate, NaN where there is no solution
+EIRSolution = namedtuple('EIRSolution', ['rate', 'converged', 'iterations'])
+
+# below this value of n * rate the annuity factor is evaluated from its taylor series around zero
+_series_cutoff = 1e-4
+
+# optional annuitytable.AnnuityTable the level-annuity solve is seeded from
+_table = None
+
+
+def seed_table(table):
+    # seed solve_eir from an annuity table (None to go back to the tangent seed); the solution is unchanged to
+    # the solver's tolerance, only fewer newton steps are needed
+    global _table
+    _table = table
+
+
+def annuity_factor(rate, n):
+    # (1 - (1 + rate) ** -n) / rate and its derivative with respect to rate, finite at rate == 0
+    rate = np.asarray(rate, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    near_zero = np.abs(n * rate) < _series_cutoff
+    safe_rate = np.where(near_zero, 1.0, rate)
+    with np.errstate(over='ignore', invalid='ignore'):
+        log_growth = np.log1p(safe_rate)
+        discount = np.exp(-n * log_growth)
+        factor = -np.expm1(-n * log_growth) / safe_rate
+        derivative = (n * discount / (1 + safe_rate) - factor) / safe_rate
+    series_factor = n - n * (n + 1) / 2 * rate + n * (n + 1) * (n + 2) / 6 * rate ** 2
+    series_derivative = -n * (n + 1) / 2 + n * (n + 1) * (n + 2) / 3 * rate
+    return np.where(near_zero, series_factor, factor), np.where(near_zero, series_derivative, derivative)
+
+
+@instrument.timed('eir.annuity')
+def solve_eir(installment_amount, num_of_pmts, presVal, tol=1e-12, maxiter=100):
+    # periodic rate for every (installment, n, present value), with per-loan convergence flags and iteration counts
+    installment_amount, num_of_pmts, presVal = np.broadcast_arrays(
+        np.asarray(installment_amount, dtype=np.float64),
+        np.asarray(num_of_pmts, dtype=np.float64),
+        np.asarray(presVal, dtype=np.float64))
+    shape = installment_amount.shape
+    installment_amount = installment_amount.ravel()
+    n = num_of_pmts.ravel()
+    presVal = presVal.ravel()
+
+    # only the ratio matters, so negative amounts (both sides negative) solve like positive ones
+    with np.errstate(divide='ignore', invalid='ignore'):
+        target = presVal / installment_amount
+    valid = np.isfinite(target) & (target > 0) & (n >= 1)
+    target = np.where(valid, target, 1.0)
+    n = np.where(valid, n, 1.0)
+
+    # the annuity factor is decreasing and convex in the rate, so starting from the root of its tangent
+    # at zero the newton iterates rise monotonically to the solution
+    rate = np.maximum(2 * (n - target) / (n * (n + 1)), -0.99)
+    if _table is not None:
+        # the tabulated rate is within the table's rate bound of the solution, so newton converges in a step or two
+        seeded = _table.rate(target, n)
+        rate = np.where(np.isnan(seeded), rate, seeded)
+    iterations = np.zeros(len(rate), dtype=np.int64)
+    converged = ~valid
+    for _ in range(maxiter):
+        active = ~converged
+        if not active.any():
+            break
+        factor, derivative = annuity_factor(rate[active], n[active])
+        step = (factor - target[active]) / derivative
+        new_rate = rate[active] - step
+        # never step past the -100% pole
+        new_rate = np.where(new_rate <= -1, (rate[active] - 1) / 2, new_rate)
+        rate[active] = new_rate
+        iterations[active] += 1
+        converged[active] = np.abs(step) <= tol * (1 + np.abs(new_rate))
+
+    converged &= valid
+    rate = np.where(converged, rate, np.nan)
+    if instrument.enabled():
+        _count('eir.annuity', converged, iterations)
+    return EIRSolution(rate.reshape(shape), converged.reshape(shape), iterations.reshape(shape))
+
+
+def _count(solver, converged, iterations):
+    instrument.count(solver + '.solves', converged.size)
+    instrument.count(solver + '.iterations', int(iterations.sum()))
+    instrument.count(solver + '.failures', int(converged.size - np.count_nonzero(converged)))
+
+
+def eirfunc(installment_amount, num_of_pmts, presVal):
+    # annual eir in percent as the brentq version returned it; works on scalars or arrays
+    eir = solve_eir(installment_amount, num_of_pmts, presVal).rate * 100 * 12
+    if eir.ndim == 0:
+        return float(eir)
+    return eir
+
+
+def _row_sums(values):
+    # sums across periods accumulated left to right, so trailing padding never changes the rounding
+    # and a loan gets the same result whatever batch it is solved in
+    total = np.zeros(values.shape[0])
+    for k in range(values.shape[1]):
+        total += values[:, k]
+    return total
+
+
+@instrument.timed('eir.cashflow')
+def solve_cashflow_eir(cashflows, presVal, tol=1e-12, maxiter=100, guess=None):
+    # periodic rate equating uneven periodic cash flows (loans x periods, NaN padded) to presVal,
+    # seeded from the level-installment solution with the same total; guess is an optional rate per loan to start
+    # from instead (the eir of similar cash flows, say), NaN where there is none
+    cashflows = np.atleast_2d(np.asarray(cashflows, dtype=np.float64))
+    n = np.count_nonzero(~np.isnan(cashflows), axis=1)
+    cashflows = np.nan_to_num(cashflows)
+    presVal = np.asarray(presVal, dtype=np.float64).ravel()
+    periods = np.arange(1, cashflows.shape[1] + 1, dtype=np.float64)
+
+    if guess is None:
+        seed = solve_eir(_row_sums(cashflows) / np.maximum(n, 1), n, presVal)
+        valid = seed.converged
+        rate = np.where(valid, seed.rate, 0.0)
+    else:
+        rate = np.broadcast_to(np.asarray(guess, dtype=np.float64), n.shape).copy()
+        valid = np.isfinite(rate) & (n > 0)
+        rest = np.flatnonzero(~np.isfinite(rate))
+        if len(rest):
+            seed = solve_eir(_row_sums(cashflows[rest]) / np.maximum(n[rest], 1), n[rest], presVal[rest])
+            valid[rest] = seed.converged
+            rate[rest] = np.where(seed.converged, seed.rate, 0.0)
+        rate[~valid] = 0.0
+    iterations = np.zeros(len(rate), dtype=np.int64)
+    converged = ~valid
+    for _ in range(maxiter):
+        active = ~converged
+        if not active.any():
+            break
+        flows = cashflows[active]
+        discount = np.exp(-periods * np.log1p(rate[active])[:, None])
+        npv = _row_sums(flows * discount) - presVal[active]
+        derivative = -_row_sums(flows * periods * discount) / (1 + rate[active])
+        step = npv / derivative
+        new_rate = rate[active] - step
+        new_rate = np.where(new_rate <= -1, (rate[active] - 1) / 2, new_rate)
+        rate[active] = new_rate
+        iterations[active] += 1
+        converged[active] = np.abs(step) <= tol * (1 + np.abs(new_rate))
+
+    converged &= valid
+    if instrument.enabled():
+        _count('eir.cashflow', converged, iterations)
+    return EIRSolution(np.where(converged, rate, np.nan), converged, iterations)
+
+
+@instrument.timed('eir.dated')
+def solve_dated_eir(cashflows, times, per_year=12, tol=1e-12, maxiter=100):
+    # periodic rate, compounded per_year times a year, at which dated cash flows (loans x flows, NaN padded,
+    # the disbursement negative) are worth zero; times are the flows' year fractions from the loan's start, and
+    # are turned into compounding periods once for all the newton iterations
+    cashflows = np.atleast_2d(np.asarray(cashflows, dtype=np.float64))
+    times = np.broadcast_to(np.asarray(times, dtype=np.float64), cashflows.shape)
+    padding = np.isnan(cashflows) | np.isnan(times)
+    cashflows = np.where(padding, 0.0, cashflows)
+    periods = np.where(padding, 0.0, times * per_year)
+
+    # the present value falls and is convex in the rate, so newton started from the root of its tangent at zero
+    # rises monotonically to the solution, like solve_eir
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = _row_sums(cashflows) / _row_sums(cashflows * periods)
+    valid = np.isfinite(rate) & (cashflows > 0).any(axis=1) & (cashflows < 0).any(axis=1)
+    rate = np.where(valid, np.maximum(rate, -0.99), 0.0)
+    iterations = np.zeros(len(rate), dtype=np.int64)
+    converged = ~valid
+    for _ in range(maxiter):
+        active = ~converged
+        if not active.any():
+            break
+        flows = cashflows[active]
+        flow_periods = periods[active]
+        discount = np.exp(-flow_periods * np.log1p(rate[active])[:, None])
+        npv = _row_sums(flows * discount)
+        derivative = -_row_sums(flows * flow_periods * discount) / (1 + rate[active])
+        step = npv / derivative
+        new_rate = rate[active] - step
+        new_rate = np.where(new_rate <= -1, (rate[active] - 1) / 2, new_rate)
+        rate[active] = new_rate
+        iterations[active] += 1
+        converged[active] = np.abs(step) <= tol * (1 + np.abs(new_rate))
+
+    converged &= valid
+    if instrument.enabled():
+        _count('eir.dated', converged, iterations)
+    return EIRSolution(np.where(converged, rate, np.nan), converged, iterations)
+
+
+def dated_eir(dates, cashflows, daycount='ACT/365', per_year=12):
+    # annual eir in percent, compounded per_year times a year like eirfunc, of dated cash flows (loans x flows,
+    # NaT / NaN padded); each loan's first date is its start, so its first flow is the disbursement net of fees
+    # (negative) and stub periods, grace periods and irregular fee flows are just dates and amounts
+    from .paycalendar import year_fractions
+    dates = np.atleast_2d(np.asarray(dates, dtype='datetime64[D]'))
+    times = year_fractions(dates[:, 0], dates, daycount)
+    return solve_dated_eir(cashflows, times, per_year).rate * 100 * per_year
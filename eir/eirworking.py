@@ -1,18 +1,15 @@
 # import the libraries
 #python version 3.7.10
-import pandas as pd
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import numpy_financial as npf
-from scipy.optimize import brentq as root
 
 # define the functions
-def eirfunc(installment_amount,num_of_pmts,presVal):
-    return root(lambda x:  installment_amount * ((1 - ((1 + x) ** (-num_of_pmts))) / x) - presVal, 0.000001, 0.999999) * 100 * 12
-
 def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount, repaymentfrequency,
                                      interestrate, upfrontfee, repaymenttype, interest_calculation_method,
                                      base_days, interest_type):
+    # heavy libraries are only loaded when a schedule is generated
+    import pandas as pd
+    
     # Convert date strings to datetime objects
     loanstartdate = datetime.strptime(loanstartdate, '%Y-%m-%d')
     loanenddate = datetime.strptime(loanenddate, '%Y-%m-%d')
@@ -100,22 +97,28 @@ def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount,
 # def eirfunc(installment_amount,num_of_pmts,presVal):
 #     return root(lambda x:  installment_amount * ((1 - ((1 + x) ** (-num_of_pmts))) / x) - presVal, 0.000001, 0.999999)###*12
 
+
 # Example usage
-loanstartdate = '2023-01-31'
-loanenddate = '2025-01-31'
-originalamount = 10000
-repaymentfrequency = 'monthly'  # Change to your desired frequency   
-interestrate = 5  # 5%
-upfrontfee = 200
-repaymenttype = 'emi'  # Change to 'emi' or 'fpi' for Equal Monthly Installment
-interest_calculation_method = 'monthly'  # Change to 'daily' or 'monthly' for daily interest calculation
-base_days = 365  # Change to 360 if using 360 days per year
-interest_type = 'variable'  # Change to 'flatrate' or 'variable' for flat rate interest on the original amount
+def main():
+    loanstartdate = '2023-01-31'
+    loanenddate = '2025-01-31'
+    originalamount = 10000
+    repaymentfrequency = 'monthly'  # Change to your desired frequency   
+    interestrate = 5  # 5%
+    upfrontfee = 200
+    repaymenttype = 'emi'  # Change to 'emi' or 'fpi' for Equal Monthly Installment
+    interest_calculation_method = 'monthly'  # Change to 'daily' or 'monthly' for daily interest calculation
+    base_days = 365  # Change to 360 if using 360 days per year
+    interest_type = 'variable'  # Change to 'flatrate' or 'variable' for flat rate interest on the original amount
+
+    repayment_schedule_df = generate_loan_repayment_schedule(
+        loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
+        interest_calculation_method, base_days, interest_type
+    )
+    print(repayment_schedule_df[['Principal','Interest']].sum())
+    print(repayment_schedule_df)
+    # repayment_schedule_df.to_csv('rep.csv')
+
 
-repayment_schedule_df = generate_loan_repayment_schedule(
-    loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
-    interest_calculation_method, base_days, interest_type
-)
-print(repayment_schedule_df[['Principal','Interest']].sum())
-print(repayment_schedule_df)
-# repayment_schedule_df.to_csv('rep.csv')
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# loan events: partial prepayment, rate reset and restructure
+# only the periods from the event onward are recomputed; the periods before it are kept as they are
+#
+# accounting policy (effective interest method):
+#   prepayment, restructure - the revised cash flows are discounted at the original eir and the difference to the
+#                             carrying amount is recognised at once as a catch-up adjustment; the eir is unchanged
+#   ratereset               - a floating rate reset re-estimates the cash flows and a revised eir is solved against
+#                             the current carrying amount, with no catch-up
+# the repayments after the event keep the loan's payment day and, for a loan floating on a curve (a finite margin),
+# its curve; such a loan takes its rates from the curve, so its rate resets and restructures change the margin
+from collections import namedtuple
+
+import numpy as np
+
+from .amortization import amortize
+from .eirsolver import solve_cashflow_eir
+from .paycalendar import anchor_days
+from .schedule import generate_portfolio_schedule, intervals, loan_columns, optional_columns
+
+event_types = ('prepayment', 'ratereset', 'restructure')
+
+# amount is the prepaid principal, rate the new interest rate in percent (margin the new margin over the curve in
+# percent, for a loan floating on one), term the number of repayments left after the event (restructure); events
+# take effect from the first repayment after their date
+LoanEvent = namedtuple('LoanEvent', ['date', 'type', 'amount', 'rate', 'term', 'margin'])
+LoanEvent.__new__.__defaults__ = (None, None, None, None)
+
+# one loan's schedule and eir columns, eir being the periodic rate
+LoanSchedule = namedtuple('LoanSchedule', ['dates', 'principal', 'interest', 'total_payment', 'running_balance',
+                                           'eirinterest', 'eirrunningbalance', 'amortizedfee', 'eir'])
+
+# first_period is the index of the first recomputed period
+EventResult = namedtuple('EventResult', ['schedule', 'catchup', 'first_period'])
+
+_columns = LoanSchedule._fields[:-1]
+
+
+def loan_schedule(schedule, amortization, i):
+    # LoanSchedule of loan i from a PortfolioSchedule and its Amortization
+    n = schedule.num_repayments[i]
+    return LoanSchedule(schedule.dates[i, :n], schedule.principal[i, :n], schedule.interest[i, :n],
+                        schedule.total_payment[i, :n], schedule.running_balance[i, :n],
+                        amortization.eirinterest[i, :n], amortization.eirrunningbalance[i, :n],
+                        amortization.amortizedfee[i, :n], amortization.eir[i])
+
+
+def _check_event(event, floating):
+    if event.type not in event_types:
+        raise ValueError("Invalid event type")
+    if event.type == 'prepayment' and event.amount is None:
+        raise ValueError("A prepayment needs an amount")
+    if floating and event.rate is not None:
+        raise ValueError("A loan floating on a curve takes its rates from the curve; reset its margin instead")
+    if not floating and event.margin is not None:
+        raise ValueError("Only a loan floating on a curve has a margin to reset")
+    if event.type == 'ratereset' and event.rate is None and event.margin is None:
+        raise ValueError("A rate reset needs a rate, or a margin for a loan floating on a curve")
+    if event.type == 'restructure':
+        if event.rate is None and event.margin is None and event.term is None:
+            raise ValueError("A restructure needs a rate, a margin or a term")
+        if event.term is not None and event.term < 1:
+            raise ValueError("A restructure needs at least one repayment")
+
+
+def apply_event(loan, schedule, event, roll='carry', curve=None):
+    # loan is the loan's row of the tape (a dict or Series), schedule its current LoanSchedule; curve is the
+    # ratecurve.RateCurve the schedule was built on, for a loan with a margin
+    if loan['interest_type'] != 'variable':
+        raise ValueError("Loan events need a variable interest schedule")
+    floating = curve is not None and 'margin' in loan and np.isfinite(np.float64(loan['margin']))
+    _check_event(event, floating)
+
+    k = int(np.searchsorted(schedule.dates, np.datetime64(event.date, 'D'), side='right'))
+    if k >= len(schedule.dates):
+        raise ValueError("Event is after the last repayment")
+    balance = schedule.running_balance[k]
+    carrying = schedule.eirrunningbalance[k]
+    interestrate = loan['interestrate']
+    margin = loan['margin'] if floating else None
+    remaining = len(schedule.dates) - k
+
+    if event.type == 'prepayment':
+        if abs(event.amount) > abs(balance) * (1 + 1e-12):
+            raise ValueError("Prepayment is larger than the outstanding balance")
+        balance = balance - event.amount
+        carrying = carrying - event.amount
+    else:
+        if event.rate is not None:
+            interestrate = event.rate
+        if event.margin is not None:
+            margin = event.margin
+        if event.type == 'restructure' and event.term is not None:
+            remaining = event.term
+
+    # contractual schedule of what is left, re-amortized from the last payment date before the event
+    start = schedule.dates[k - 1] if k else np.datetime64(loan['loanstartdate'], 'D')
+    months = start.astype('datetime64[M]') + remaining * intervals[loan['repaymentfrequency']]
+    tape = {name: [loan[name]] for name in loan_columns + optional_columns + ['margin'] if name in loan}
+    tape.update(loanstartdate=[start], loanenddate=[months.astype('datetime64[D]')], originalamount=[balance],
+                interestrate=[interestrate], anchor_day=anchor_days([loan['loanstartdate']]))
+    if floating:
+        tape['margin'] = [margin]
+    if balance == 0:
+        tail = None
+        flows = np.zeros((1, 0))
+    else:
+        tail = generate_portfolio_schedule(tape, roll, curve)
+        flows = tail.total_payment
+
+    if event.type == 'ratereset':
+        eir = solve_cashflow_eir(flows, carrying).rate[0]
+        opening = carrying
+    else:
+        eir = schedule.eir
+        opening = np.sum(flows[0] / (1 + eir) ** np.arange(1, flows.shape[1] + 1))
+    catchup = opening - carrying
+
+    if tail is None:
+        revised = {name: getattr(schedule, name)[:k] for name in _columns}
+    else:
+        amortization = amortize(flows, opening, interest=tail.interest, eir=eir)
+        recomputed = {
+            'dates': tail.dates[0], 'principal': tail.principal[0], 'interest': tail.interest[0],
+            'total_payment': tail.total_payment[0], 'running_balance': tail.running_balance[0],
+            'eirinterest': amortization.eirinterest[0], 'eirrunningbalance': amortization.eirrunningbalance[0],
+            'amortizedfee': amortization.amortizedfee[0],
+        }
+        revised = {name: np.concatenate([getattr(schedule, name)[:k], recomputed[name]]) for name in _columns}
+    return EventResult(LoanSchedule(eir=eir, **revised), catchup, k)
@@ -1,19 +1,16 @@
 # import the libraries
 #python version 3.7.10
-import pandas as pd
-import numpy as np
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import numpy_financial as npf
-from scipy.optimize import brentq as root
 
 # define the functions
-def eirfunc(installment_amount,num_of_pmts,presVal):
-    return root(lambda x:  installment_amount * ((1 - ((1 + x) ** (-num_of_pmts))) / x) - presVal, 0.000001, 0.999999) * 100 * 12
-
 def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount, repaymentfrequency,
                                      interestrate, upfrontfee, repaymenttype, interest_calculation_method,
                                      base_days, interest_type):
+    # heavy libraries are only loaded when a schedule is generated
+    import pandas as pd
+    from .amortization import amortize
+    
     # Convert date strings to datetime objects
     loanstartdate = datetime.strptime(loanstartdate, '%Y-%m-%d')
     loanenddate = datetime.strptime(loanenddate, '%Y-%m-%d')
@@ -106,11 +103,15 @@ def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount,
     repayment_schedule_df = pd.DataFrame(repayment_schedule)
     
     #add new columns with eir computaitons
-    
-    eir = eirfunc(total_payment_per_installment, num_repayments, originalamount-upfrontfee)
-    repayment_schedule_df['eir'] = eir
-    repayment_schedule_df['eirinterest']=-npf.ipmt(eir/100/12/repayment_interval,repayment_schedule_df.index+1,num_repayments,originalamount-upfrontfee)
-    repayment_schedule_df['armortizedfee']=repayment_schedule_df['eirinterest']-repayment_schedule_df['Interest']
+    # the eir is the periodic rate of the repayments against the amount net of the fee, annualised by the number
+    # of payments per year; the carrying amount is rebuilt back from the last repayment by discounting at that
+    # periodic rate and eir interest is its change each period, the first period taking up any gap between the
+    # amount net of the fee and the discounted repayments
+    amortization = amortize(repayment_schedule_df['Total Payment'].values, originalamount - upfrontfee,
+                            interest=repayment_schedule_df['Interest'].values)
+    repayment_schedule_df['eir'] = amortization.eir[0] * 100 * num_payment_per_year
+    repayment_schedule_df['eirinterest'] = amortization.eirinterest[0]
+    repayment_schedule_df['armortizedfee'] = amortization.amortizedfee[0]
     
     return repayment_schedule_df
     
@@ -119,24 +120,28 @@ def generate_loan_repayment_schedule(loanstartdate, loanenddate, originalamount,
 # def eirfunc(installment_amount,num_of_pmts,presVal):
 #     return root(lambda x:  installment_amount * ((1 - ((1 + x) ** (-num_of_pmts))) / x) - presVal, 0.000001, 0.999999)###*12
 
+
 # Example usage
-loanstartdate = '2023-01-31'
-loanenddate = '2025-01-31'
-originalamount = 10000
-repaymentfrequency = 'monthly'  # Change to your desired frequency   
-interestrate = 5  # 5%
-upfrontfee = 200
-repaymenttype = 'emi'  # Change to 'emi' or 'fpi' for Equal Monthly Installment
-interest_calculation_method = 'monthly'  # Change to 'daily' or 'monthly' for daily interest calculation
-base_days = 365  # Change to 360 if using 360 days per year
-interest_type = 'variable'  # Change to 'flatrate' or 'variable' for flat rate interest on the original amount
+def main():
+    loanstartdate = '2023-01-31'
+    loanenddate = '2025-01-31'
+    originalamount = 10000
+    repaymentfrequency = 'monthly'  # Change to your desired frequency   
+    interestrate = 5  # 5%
+    upfrontfee = 200
+    repaymenttype = 'emi'  # Change to 'emi' or 'fpi' for Equal Monthly Installment
+    interest_calculation_method = 'monthly'  # Change to 'daily' or 'monthly' for daily interest calculation
+    base_days = 365  # Change to 360 if using 360 days per year
+    interest_type = 'variable'  # Change to 'flatrate' or 'variable' for flat rate interest on the original amount
 
-repayment_schedule_df = generate_loan_repayment_schedule(
-    loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
-    interest_calculation_method, base_days, interest_type
-)
-print(repayment_schedule_df[['Principal','Interest','eirinterest','armortizedfee']].sum())
-print(repayment_schedule_df)
-# repayment_schedule_df.to_csv('reep2.csv')
+    repayment_schedule_df = generate_loan_repayment_schedule(
+        loanstartdate, loanenddate, originalamount, repaymentfrequency, interestrate, upfrontfee, repaymenttype,
+        interest_calculation_method, base_days, interest_type
+    )
+    print(repayment_schedule_df[['Principal','Interest','eirinterest','armortizedfee']].sum())
+    print(repayment_schedule_df)
+    # repayment_schedule_df.to_csv('reep2.csv')
 
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# fixed-point mode: money carried as int64 minor units (cents at scale 100) through the schedule and the eir
+# amortization, so the columns reconcile exactly: principal adds up to the original amount and the amortized fee
+# to the upfront fee
+#
+# the float schedule supplies the rates: each period's interest is the rounded product of the integer balance and
+# the period's rate (the float interest over the float balance), flat-rate interest is rounded once, an emi pays
+# its rounded installment and the balance runs in integers; the last repayment takes whatever balance is left
+# (the true-up). The eir is solved on the rounded cash flows and the carrying amount after each period is rounded,
+# from the booked amount less fee down to exactly zero after the last repayment; eir interest is the difference
+from collections import namedtuple
+
+import numpy as np
+
+from .amortization import Amortization
+from .eirsolver import solve_cashflow_eir
+from .schedule import PortfolioSchedule
+
+# scale is minor units per unit of currency; rounding one of rounding_modes
+FixedPoint = namedtuple('FixedPoint', ['scale', 'rounding'])
+
+# loans x periods int64 minor units, 0 past each loan's last repayment; eir is the periodic rate per loan
+MinorUnits = namedtuple('MinorUnits', ['scale', 'principal', 'interest', 'total_payment', 'running_balance',
+                                       'eir', 'eirinterest', 'eirrunningbalance', 'amortizedfee'])
+
+# half_even rounds halves to the even neighbour (banker's rounding), half_up rounds them away from zero and down
+# truncates toward zero
+rounding_modes = ('half_even', 'half_up', 'down')
+
+cents = FixedPoint(100, 'half_even')
+
+
+def _round(values, rounding):
+    # whole minor units of finite float minor units; values are first rounded to a millionth of a minor unit, so
+    # an amount like 0.285 that float stores as 28.4999... minor units is still rounded as a half
+    values = np.round(values, 6)
+    if rounding == 'half_even':
+        values = np.rint(values)
+    elif rounding == 'half_up':
+        values = np.copysign(np.floor(np.abs(values) + 0.5), values)
+    elif rounding == 'down':
+        values = np.trunc(values)
+    else:
+        raise ValueError("Invalid rounding mode")
+    return values.astype(np.int64)
+
+
+def to_minor(values, scale=100, rounding='half_even'):
+    # int64 minor units of float amounts, 0 for NaN
+    return _round(np.nan_to_num(np.asarray(values, dtype=np.float64) * scale), rounding)
+
+
+def minor_schedule(schedule, emi, flatrate, scale=100, rounding='half_even'):
+    # principal, interest, total payment and opening balance of a PortfolioSchedule in minor units; emi and
+    # flatrate flag the loans' repayment and interest types
+    mask = schedule.period_mask()
+    num_repayments = schedule.num_repayments
+    shape = mask.shape
+    principal = np.empty(shape, dtype=np.int64)
+    interest = np.empty(shape, dtype=np.int64)
+    running_balance = np.empty(shape, dtype=np.int64)
+
+    balance = to_minor(schedule.running_balance[:, 0], scale, rounding) if schedule.num_periods \
+        else np.zeros(len(schedule), dtype=np.int64)
+    last = num_repayments - 1
+    # the padding after a loan's last repayment is NaN in the float schedule and is zeroed below
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in range(schedule.num_periods):
+            opening = schedule.running_balance[:, k]
+            rate = np.where(opening != 0, schedule.interest[:, k] / opening, 0.0)
+            interest_payment = _round(np.where(flatrate, schedule.interest[:, k] * scale, balance * rate), rounding)
+            installment = _round(np.where(emi, schedule.total_payment[:, k], schedule.principal[:, k]) * scale,
+                                 rounding)
+            principal_payment = np.where(emi, installment - interest_payment, installment)
+            principal_payment = np.where(k < last, principal_payment, balance)
+            principal[:, k] = principal_payment
+            interest[:, k] = interest_payment
+            running_balance[:, k] = balance
+            balance = balance - principal_payment
+    # periods past the last repayment (which left a zero balance) are zero
+    outside = ~mask
+    principal[outside] = 0
+    interest[outside] = 0
+    running_balance[outside] = 0
+    return principal, interest, principal + interest, running_balance
+
+
+def minor_amortize(cashflows, interest, mask, carrying_amount, rounding='half_even', eir=None, scale=100):
+    # eir interest, carrying amount and amortized fee in minor units for integer cash flows and contractual
+    # interest (loans x periods, mask flags the periods that exist) and the initial carrying amount
+    if eir is None:
+        # the true-up can leave very uneven flows, whose newton steps may overflow on the way to the root
+        with np.errstate(over='ignore', invalid='ignore'):
+            eir = solve_cashflow_eir(np.where(mask, cashflows / scale, np.nan), carrying_amount / scale).rate
+    # the carrying amount after each period is the rest of the flows discounted at the eir, rebuilt back from the
+    # last repayment, where it is zero; unlike rolling the rounded amounts forward this never compounds a
+    # rounding error, whatever the eir (loans without an eir are discounted at zero)
+    growth = 1 + np.nan_to_num(eir)
+    closing = np.empty(cashflows.shape)
+    remaining = np.zeros(len(carrying_amount))
+    for k in range(cashflows.shape[1] - 1, -1, -1):
+        closing[:, k] = remaining
+        remaining = (remaining + cashflows[:, k]) / growth
+    closing = _round(closing, rounding)
+    eirrunningbalance = np.concatenate([carrying_amount[:, None], closing[:, :-1]], axis=1)
+    # so each period's eir interest is the change in the rounded carrying amount, and the booked carrying amount
+    # (amount less fee) and the zero after the last repayment make them add up to the fee exactly
+    eirinterest = closing - eirrunningbalance + cashflows
+    outside = ~mask
+    eirinterest[outside] = 0
+    eirrunningbalance[outside] = 0
+    return eir, eirinterest, eirrunningbalance, eirinterest - interest
+
+
+def fixed_point_schedule(loans, schedule, upfrontfee, fixed=cents):
+    # MinorUnits of a PortfolioSchedule computed for the loans (tape chunk) with their upfront fees
+    emi = np.asarray(loans['repaymenttype']).astype(str) == 'emi'
+    flatrate = np.asarray(loans['interest_type']).astype(str) == 'flatrate'
+    principal, interest, total_payment, running_balance = minor_schedule(schedule, emi, flatrate, fixed.scale,
+                                                                         fixed.rounding)
+    carrying_amount = running_balance[:, 0] - to_minor(upfrontfee, fixed.scale, fixed.rounding) \
+        if schedule.num_periods else np.zeros(len(schedule), dtype=np.int64)
+    eir, eirinterest, eirrunningbalance, amortizedfee = minor_amortize(
+        total_payment, interest, schedule.period_mask(), carrying_amount, fixed.rounding, scale=fixed.scale)
+    return MinorUnits(fixed.scale, principal, interest, total_payment, running_balance, eir, eirinterest,
+                      eirrunningbalance, amortizedfee)
+
+
+def to_float(minor, schedule):
+    # the PortfolioSchedule and Amortization of MinorUnits as float amounts (exact decimals, NaN padded), the
+    # form the ScheduleTable and the csv take
+    inside = schedule.period_mask()
+
+    def amounts(values):
+        return np.divide(values, minor.scale, out=np.full(values.shape, np.nan), where=inside)
+
+    eirinterest = amounts(minor.eirinterest)
+    floats = PortfolioSchedule(schedule.dates, amounts(minor.principal), amounts(minor.interest),
+                               amounts(minor.total_payment), amounts(minor.running_balance),
+                               schedule.num_repayments, schedule.repayment_interval, schedule.installment,
+                               schedule.days_in_period)
+    amortization = Amortization(minor.eir, np.isfinite(minor.eir), eirinterest, floats.total_payment - eirinterest,
+                                amounts(minor.eirrunningbalance), amounts(minor.amortizedfee))
+    return floats, amortization
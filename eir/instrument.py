@@ -0,0 +1,154 @@
+# opt-in instrumentation of the batch engine: per-stage timers and counters
+# the hooks sit at stage level (once per batch, never per loan or period) and do nothing but a global check
+# until instrumentation is enabled:
+#
+#   stats = instrument.enable()
+#   ... run schedules ...
+#   print(stats.to_json())
+import functools
+import json
+import re
+import time
+from contextlib import contextmanager
+
+_stats = None
+
+
+class Stats:
+    # timers hold [calls, seconds] per stage, counters a running total per name
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+
+    def record(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+
+    def add(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        # adds the timers and counters of another Stats or of its as_dict(), e.g. from a worker process
+        if isinstance(other, Stats):
+            other = other.as_dict()
+        for name, timer in other['timers'].items():
+            current = self.timers.setdefault(name, [0, 0.0])
+            current[0] += timer['calls']
+            current[1] += timer['seconds']
+        for name, value in other['counters'].items():
+            self.add(name, value)
+
+    def as_dict(self):
+        return {
+            'timers': {name: {'calls': calls, 'seconds': seconds}
+                       for name, (calls, seconds) in sorted(self.timers.items())},
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def to_prometheus(self, prefix='eir'):
+        # prometheus text exposition format: stage timers as labelled counters, one metric per counter
+        lines = ['# HELP %s_stage_seconds_total Time spent in each stage.' % prefix,
+                 '# TYPE %s_stage_seconds_total counter' % prefix]
+        lines += ['%s_stage_seconds_total{stage="%s"} %r' % (prefix, name, seconds)
+                  for name, (_, seconds) in sorted(self.timers.items())]
+        lines += ['# HELP %s_stage_calls_total Calls of each stage.' % prefix,
+                  '# TYPE %s_stage_calls_total counter' % prefix]
+        lines += ['%s_stage_calls_total{stage="%s"} %d' % (prefix, name, calls)
+                  for name, (calls, _) in sorted(self.timers.items())]
+        for name, value in sorted(self.counters.items()):
+            metric = '%s_%s_total' % (prefix, re.sub(r'[^a-zA-Z0-9_]', '_', name))
+            lines += ['# TYPE %s counter' % metric, '%s %r' % (metric, value)]
+        return '\n'.join(lines) + '\n'
+
+
+def enable(stats=None):
+    # start collecting into stats (a new Stats by default) and return it
+    global _stats
+    _stats = Stats() if stats is None else stats
+    return _stats
+
+
+def disable():
+    # stop collecting and return what was collected
+    global _stats
+    stats, _stats = _stats, None
+    return stats
+
+
+def current():
+    # the Stats being collected into, None when instrumentation is off
+    return _stats
+
+
+def enabled():
+    return _stats is not None
+
+
+@contextmanager
+def _timed(stats, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.record(name, time.perf_counter() - started)
+
+
+class _Disabled:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_disabled = _Disabled()
+
+
+def timer(name):
+    # context manager timing one stage; a shared no-op when instrumentation is off
+    if _stats is None:
+        return _disabled
+    return _timed(_stats, name)
+
+
+def timed(name):
+    # decorator timing every call of a function as one stage
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _stats is None:
+                return function(*args, **kwargs)
+            with _timed(_stats, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_iter(name, iterable):
+    # times the production of each item of an iterable (e.g. reading the next chunk of a tape) as one stage
+    iterator = iter(iterable)
+    while True:
+        with timer(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def count(name, value=1):
+    if _stats is not None:
+        _stats.add(name, value)
+
+
+def write(stats, path):
+    # json, or the prometheus text format for a .prom file
+    with open(path, 'w') as f:
+        f.write(stats.to_prometheus() if path.endswith('.prom') else stats.to_json(indent=1) + '\n')
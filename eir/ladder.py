@@ -0,0 +1,77 @@
+# cash-flow ladder: contractual principal and interest of the book (and the fee amortized with them) by time band
+# after an as-of date, optionally by segment
+# each chunk's repayments are scatter-added into day x segment buckets as the chunk is computed (a
+# ReportingAggregator by day), so the ladder for any as-of date is the daily totals summed between its band edges:
+# a new as-of date is a cumulative sum over the days, not a new run over the tape
+#
+# repayments on or before the as-of date are treated as paid and left out; principal and interest are the contractual
+# cash flows, armortizedfee the fee recognised as income in the band (eir interest less interest), which is not cash
+import numpy as np
+
+from .aggregate import ReportingAggregator, accumulate_tape
+
+# amounts laddered by default
+ladder_columns = ['Principal', 'Interest', 'Total Payment', 'armortizedfee']
+
+# (label, months after the as-of date the band ends); the last band (None) is open ended
+default_bands = (('0-1m', 1), ('1-3m', 3), ('3-12m', 12), ('1-5y', 60), ('>5y', None))
+
+
+def add_months(date, months):
+    # date plus whole months, the day clipped to the month end
+    date = np.datetime64(date, 'D')
+    month = date.astype('datetime64[M]')
+    day = (date - month.astype('datetime64[D]')).astype(np.int64)
+    target = month + months
+    last_day = ((target + 1).astype('datetime64[D]') - target.astype('datetime64[D]')).astype(np.int64) - 1
+    return target.astype('datetime64[D]') + min(day, last_day)
+
+
+class CashflowLadder(ReportingAggregator):
+    # daily totals of the columns per segment; add(table, labels) like the reporting aggregator, then ladder(asof)
+    # as often as needed
+    unit = 'D'
+
+    def __init__(self, by=(), columns=None):
+        ReportingAggregator.__init__(self, by, ladder_columns if columns is None else columns)
+
+    def ladder(self, asof, bands=default_bands):
+        # one row per band and segment: the totals of the repayments after asof up to the band's end, and the
+        # cumulative cash flow (total payment) by the band's end
+        import pandas as pd
+        asof = np.datetime64(asof, 'D')
+        # the aggregator's months are days here
+        first_day = self._first_month or 0
+        totals = self._totals if self._totals.shape[2] else np.zeros((len(self.columns), 0, 1))
+        num_days = totals.shape[1]
+        # totals up to and including each day, with the zero before the first one
+        cumulative = np.concatenate([np.zeros((len(self.columns), 1, totals.shape[2])), np.cumsum(totals, axis=1)],
+                                    axis=1)
+
+        def position(date):
+            # number of days with repayments on or before date
+            return int(np.clip(date.astype(np.int64) - first_day + 1, 0, num_days))
+
+        edges = [position(asof)]
+        for _, months in bands:
+            edges.append(num_days if months is None else max(position(add_months(asof, months)), edges[-1]))
+        band_totals = cumulative[:, edges[1:]] - cumulative[:, edges[:-1]]
+
+        segments = list(self._segments) or [()]
+        band, segment = np.meshgrid(np.arange(len(bands)), np.arange(len(segments)), indexing='ij')
+        band, segment = band.ravel(), segment.ravel()
+        frame = pd.DataFrame({'band': [bands[i][0] for i in band]})
+        for i, name in enumerate(self.by):
+            frame[name] = [segments[code][i] for code in segment]
+        for i, name in enumerate(self.columns):
+            frame[name] = band_totals[i][band, segment]
+        if 'Total Payment' in self.columns:
+            # cash in by the end of each band, the running sum of the bands so far for every segment
+            inflows = band_totals[self.columns.index('Total Payment')]
+            frame['cumulative'] = np.cumsum(inflows, axis=0)[band, segment]
+        return frame
+
+
+def ladder_tape(tape, by=(), chunksize=100000, workers=1, cache_bytes=None, roll='carry', curve=None, columns=None):
+    # CashflowLadder of a loan tape by segment
+    return accumulate_tape(CashflowLadder(by, columns), tape, chunksize, workers, cache_bytes, roll, curve)
@@ -0,0 +1,56 @@
+# byte-capped least-recently-used store shared by the schedule, eir and calendar caches
+from collections import OrderedDict
+
+from . import instrument
+
+
+class LRUCache:
+    # least recently used entries are evicted once the stored bytes go over max_bytes; name labels the
+    # hit and miss counters of the instrumentation
+    def __init__(self, max_bytes, name='cache'):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, record=True):
+        # record=False looks up without counting a hit or miss
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += record
+            if record and instrument.enabled():
+                instrument.count('cache.%s.misses' % self.name)
+            return None
+        self._entries.move_to_end(key)
+        self.hits += record
+        if record and instrument.enabled():
+            instrument.count('cache.%s.hits' % self.name)
+        return entry[0]
+
+    def put(self, key, value, size):
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            self.bytes -= self._entries.popitem(last=False)[1][1]
+            self.evictions += 1
+            instrument.count('cache.%s.evictions' % self.name)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,129 @@
+# columnar output of schedules: ScheduleTables written as Arrow record batches to a parquet file
+# dates are date32, periods int32 and amounts float64, so nothing is formatted as text; loanid and any key columns
+# of the tape (product, branch, ...) are dictionary-encoded, one code per repayment and each label stored once per
+# row group. Repayments are grouped by reporting month (the month end of the repayment date, also a column): pending
+# rows are kept per month and written as one row group per month once enough have built up, so a reader that wants a
+# month reads its row groups only (their statistics on month and Date let pyarrow / pandas filters skip the rest)
+#
+# the csv output stays the default; parquet needs pyarrow and is only imported when a writer is opened
+import numpy as np
+
+from .columnar import output_columns
+
+# rows held back before the pending months are written out as row groups
+default_buffer_rows = 1 << 20
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("writing parquet schedules requires pyarrow")
+    return pa, pq
+
+
+def _dictionary(pa, labels, codes):
+    # dictionary array of the per-loan labels indexed per repayment by codes (loan positions)
+    values, inverse = np.unique(np.asarray(labels), return_inverse=True)
+    return pa.DictionaryArray.from_arrays(pa.array(inverse.ravel().astype(np.int32)[codes]), pa.array(values))
+
+
+def reporting_month(dates):
+    # month end of each date
+    return ((dates.astype('datetime64[M]') + 1).astype('datetime64[D]') - 1)
+
+
+def to_arrow(table, keys=None):
+    # pyarrow Table of a ScheduleTable in the pipeline's column order, plus the carrying amount and the reporting
+    # month; keys maps tape columns to one label per loan of the table
+    pa, _ = _pyarrow()
+    columns = {}
+    for name in output_columns:
+        if name == 'loanid':
+            columns[name] = _dictionary(pa, table.loanids, table.loan)
+        elif name == 'Date':
+            columns[name] = pa.array(table.date)
+        else:
+            columns[name] = pa.array(table.column(name))
+    columns['eirrunningbalance'] = pa.array(table.column('eirrunningbalance'))
+    columns['month'] = pa.array(reporting_month(table.date))
+    for name, labels in (keys or {}).items():
+        columns[name] = _dictionary(pa, np.asarray(labels).astype(str), table.loan)
+    return pa.table(columns)
+
+
+class ParquetScheduleWriter:
+    # streaming writer: append(table, keys) for every chunk of a run, close() at the end (or use it as a context
+    # manager); rows of a month keep the order they were appended in
+    def __init__(self, path, compression='zstd', buffer_rows=default_buffer_rows):
+        self.path = path
+        self.compression = compression
+        self.buffer_rows = buffer_rows
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._pending = {}
+        self._pending_rows = 0
+
+    def append(self, table, keys=None):
+        if not len(table):
+            return
+        pa, pq = _pyarrow()
+        batch = to_arrow(table, keys)
+        if self._schema is None:
+            self._schema = batch.schema
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression=self.compression)
+        else:
+            batch = batch.cast(self._schema)
+        # split the chunk by reporting month, stable so every month stays in loan and period order
+        month = table.date.astype('datetime64[M]').astype(np.int64)
+        order = np.argsort(month, kind='stable')
+        months, starts = np.unique(month[order], return_index=True)
+        batch = batch.take(pa.array(order))
+        for value, start, stop in zip(months.tolist(), starts, list(starts[1:]) + [len(order)]):
+            self._pending.setdefault(value, []).append(batch.slice(start, stop - start))
+        self._pending_rows += len(order)
+        self.rows += len(order)
+        if self._pending_rows >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        # one row group per pending month, in month order
+        pa, _ = _pyarrow()
+        for value in sorted(self._pending):
+            # the chunks of a month were encoded apart; one dictionary per column for the row group
+            group = pa.concat_tables(self._pending[value]).unify_dictionaries()
+            self._writer.write_table(group, row_group_size=len(group))
+        self._pending = {}
+        self._pending_rows = 0
+
+    def close(self):
+        if self._writer is None:
+            # nothing appended: an empty file with the schedule columns
+            pa, pq = _pyarrow()
+            empty = {name: pa.array([], type=pa.float64()) for name in output_columns + ['eirrunningbalance']}
+            empty.update(loanid=pa.array([], type=pa.string()), Period=pa.array([], type=pa.int32()),
+                         Date=pa.array([], type=pa.date32()), month=pa.array([], type=pa.date32()))
+            pq.write_table(pa.table(empty), self.path, compression=self.compression)
+            return
+        self.flush()
+        self._writer.close()
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_months(path, first, last=None, columns=None):
+    # DataFrame of the repayments whose reporting month falls between the months of first and last (inclusive),
+    # reading only the row groups of those months
+    pa, pq = _pyarrow()
+    first = reporting_month(np.datetime64(first, 'D'))
+    last = first if last is None else reporting_month(np.datetime64(last, 'D'))
+    filters = [('month', '>=', first.item()), ('month', '<=', last.item())]
+    return pq.read_table(path, columns=columns, filters=filters).to_pandas()
+
@@ -0,0 +1,148 @@
+# payment date calendar and day counts for whole cohorts of loans
+# a grid of payment dates and accrual days is built once per (start date, repayment interval, term, roll)
+# and shared by every loan with the same terms
+from collections import namedtuple
+
+import numpy as np
+
+from .lru import LRUCache
+
+# how payment dates move from month to month:
+#   carry - roll forward one interval at a time like relativedelta, so a clipped day is carried on
+#           (2023-01-31 -> 02-28 -> 03-28); accrual days are measured back one interval from each payment date
+#   eom   - anchor every date on the start day, clipped to the month end, and keep month-end starts on the
+#           month end (2023-01-31 -> 02-28 -> 03-31); accrual days run from the previous payment date
+# an eom calendar can be given its anchor day (31 for the month end) instead of taking it from the start date, for a
+# schedule that restarts from a clipped payment date of an earlier one (a loan event)
+rolls = ('carry', 'eom')
+
+# day count conventions and their year basis
+daycounts = {
+    'ACT/365': 365,
+    'ACT/360': 360,
+    '30/360': 360,
+}
+
+# dates, days and year_fraction are loans x periods, NaT / 0 after each loan's last payment
+PaymentCalendar = namedtuple('PaymentCalendar', ['dates', 'days', 'year_fraction'])
+
+grid_cache = LRUCache(64 * 2 ** 20, 'calendar')
+
+
+def _days_in_month(months):
+    return ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+
+
+def _days_30_360(start_months, start_day, end_months, end_day):
+    # 30/360 bond basis: day 31 counts as 30, and so does a closing 31st after an opening 30th
+    start_day = np.minimum(start_day, 30)
+    end_day = np.where((end_day == 31) & (start_day == 30), 30, end_day)
+    months = (end_months - start_months).astype(np.int64)
+    return 30 * months + end_day - start_day
+
+
+def anchor_days(start):
+    # the day eom payment dates are anchored on: the start day, or 31 for loans starting on a month end
+    start = np.asarray(start, dtype='datetime64[D]')
+    start_month = start.astype('datetime64[M]')
+    start_day = (start - start_month.astype('datetime64[D]')).astype(np.int64) + 1
+    return np.where(start_day == _days_in_month(start_month), 31, start_day)
+
+
+def _build_grids(start, interval, num_periods, roll, anchor=None):
+    # payment dates, actual days and 30/360 days for a batch of (start, interval) rows; anchor (eom only) is the
+    # anchor day of every row, 0 for the start date's own
+    start_month = start.astype('datetime64[M]')
+    start_day = (start - start_month.astype('datetime64[D]')).astype(np.int64) + 1
+    steps = np.arange(1, num_periods + 1)
+    months = start_month[:, None] + (steps * interval[:, None]).astype('timedelta64[M]')
+    month_days = _days_in_month(months)
+
+    if roll == 'carry':
+        day = np.minimum.accumulate(np.minimum(start_day[:, None], month_days), axis=1)
+        previous_months = months - interval[:, None].astype('timedelta64[M]')
+        previous_day = np.minimum(day, _days_in_month(previous_months))
+    elif roll == 'eom':
+        own = anchor_days(start)
+        anchor = own if anchor is None else np.where(anchor > 0, anchor, own)
+        day = np.minimum(anchor[:, None], month_days)
+        previous_months = np.concatenate([start_month[:, None], months[:, :-1]], axis=1)
+        previous_day = np.concatenate([start_day[:, None], day[:, :-1]], axis=1)
+    else:
+        raise ValueError("Invalid date roll")
+
+    dates = months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    previous = previous_months.astype('datetime64[D]') + (previous_day - 1).astype('timedelta64[D]')
+    actual_days = (dates - previous).astype(np.int64)
+    days_30_360 = _days_30_360(previous_months, previous_day, months, day)
+    return dates, actual_days, days_30_360
+
+
+def payment_grids(loanstartdate, repayment_interval, num_repayments, roll='carry', cache=None, anchor_day=None):
+    # dates, actual days and 30/360 days per loan, built once per distinct (start, interval, term, roll, anchor);
+    # anchor_day, per loan, overrides the eom anchor (0 keeps the start date's)
+    cache = grid_cache if cache is None else cache
+    start = np.asarray(loanstartdate, dtype='datetime64[D]')
+    keys = np.empty(len(start), dtype=[('start', 'i8'), ('interval', 'i8'), ('term', 'i8'), ('anchor', 'i8')])
+    keys['start'] = start.astype(np.int64)
+    keys['interval'] = repayment_interval
+    keys['term'] = num_repayments
+    keys['anchor'] = 0 if anchor_day is None or roll != 'eom' else anchor_day
+    unique, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+
+    grids = [cache.get(key + (roll,)) for key in unique.tolist()]
+    missing = [i for i, grid in enumerate(grids) if grid is None]
+    if missing:
+        batch = unique[missing]
+        built = _build_grids(batch['start'].astype('datetime64[D]'), batch['interval'],
+                             int(batch['term'].max()), roll, batch['anchor'])
+        for j, i in enumerate(missing):
+            n = unique['term'][i]
+            grid = tuple(np.ascontiguousarray(values[j, :n]) for values in built)
+            cache.put(unique[i].tolist() + (roll,), grid, sum(values.nbytes for values in grid))
+            grids[i] = grid
+
+    # stack the distinct grids once and hand each loan its row
+    num_periods = int(unique['term'].max()) if len(unique) else 0
+    dates = np.full((len(unique), num_periods), np.datetime64('NaT'), dtype='datetime64[D]')
+    actual_days = np.zeros((len(unique), num_periods), dtype=np.int64)
+    days_30_360 = np.zeros((len(unique), num_periods), dtype=np.int64)
+    for i, (grid_dates, grid_actual, grid_30_360) in enumerate(grids):
+        n = len(grid_dates)
+        dates[i, :n] = grid_dates
+        actual_days[i, :n] = grid_actual
+        days_30_360[i, :n] = grid_30_360
+    return dates[inverse], actual_days[inverse], days_30_360[inverse]
+
+
+def payment_calendar(loanstartdate, repayment_interval, num_repayments, daycount='ACT/365', roll='carry',
+                     cache=None, anchor_day=None):
+    # payment dates, accrual days and year fractions under a day count convention (one for all loans or
+    # one per loan)
+    dates, actual_days, days_30_360 = payment_grids(loanstartdate, repayment_interval, num_repayments, roll,
+                                                    cache, anchor_day)
+    daycount = np.broadcast_to(np.asarray(daycount).astype(str), (len(dates),))
+    for convention in np.unique(daycount):
+        if convention not in daycounts:
+            raise ValueError("Invalid day count convention")
+    thirty = (daycount == '30/360')[:, None]
+    days = np.where(thirty, days_30_360, actual_days)
+    basis = np.where(daycount == 'ACT/365', 365.0, 360.0)[:, None]
+    return PaymentCalendar(dates, days, days / basis)
+
+
+def year_fractions(start, dates, daycount='ACT/365'):
+    # years from each loan's start to each of its dates (loans x dates, NaN for NaT) under a day count convention
+    start = np.asarray(start, dtype='datetime64[D]')[:, None]
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    if daycount not in daycounts:
+        raise ValueError("Invalid day count convention")
+    if daycount == '30/360':
+        start_months = start.astype('datetime64[M]')
+        months = dates.astype('datetime64[M]')
+        days = _days_30_360(start_months, (start - start_months.astype('datetime64[D]')).astype(np.int64) + 1,
+                            months, (dates - months.astype('datetime64[D]')).astype(np.int64) + 1)
+    else:
+        days = (dates - start).astype(np.int64)
+    return np.where(np.isnat(dates), np.nan, days / daycounts[daycount])
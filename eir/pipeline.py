@@ -0,0 +1,214 @@
+# streaming loan tape pipeline
+# reads the tape in fixed-size chunks, builds schedules and eir columns per chunk and appends them to the output,
+# so memory is bounded by the chunk size; a checkpoint file records the last completed chunk for resuming
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+from . import instrument
+
+# chunks, loans and rows count everything completed so far, rows_per_second only this run;
+# chunk_seconds is the compute time of the last chunk
+PipelineStats = namedtuple('PipelineStats', ['chunks', 'loans', 'rows', 'seconds', 'rows_per_second',
+                                             'chunk_seconds'])
+
+
+# repayments generated together at most, and how much longer the longest loan of a batch may be than its shortest
+batch_rows = 1 << 18
+batch_spread = 1.5
+
+
+def term_batches(num_repayments, max_rows=batch_rows, spread=batch_spread):
+    # positions of the loans in batches of similar term, so each batch's loans x periods arrays are mostly filled
+    # and hold about max_rows repayments at most (a single loan longer than that is a batch of its own)
+    import numpy as np
+
+    order = np.argsort(num_repayments, kind='stable')
+    terms = np.maximum(num_repayments[order], 1)
+    bucket = np.floor(np.log(terms) / np.log(spread)).astype(np.int64)
+    batches = []
+    for rows in np.split(order, np.flatnonzero(np.diff(bucket)) + 1):
+        if not len(rows):
+            continue
+        size = max(max_rows // max(int(num_repayments[rows[-1]]), 1), 1)
+        batches.extend(rows[i:i + size] for i in range(0, len(rows), size))
+    return batches
+
+
+@instrument.timed('pipeline.compute')
+def compute_chunk(loans, first_row=0, cache=None, roll='carry', curve=None, fixed=None):
+    # ScheduleTable for one chunk of the tape; loans without a loanid are numbered by tape row;
+    # cache is an optional ScheduleCache shared between chunks, roll the payment date roll and curve an optional
+    # ratecurve.RateCurve for floating-rate loans (floating schedules depend on their dates, so they bypass the cache);
+    # fixed, a fixedpoint.FixedPoint, computes the amounts in integer minor units instead of floats
+    # the table is allocated once and the loans are generated in term_batches written straight into it, so the
+    # loans x periods arrays of the engine never cover the whole chunk
+    import numpy as np
+    from .columnar import ScheduleTable
+    from .schedule import parse_loan_terms
+
+    num_repayments = parse_loan_terms(loans).num_repayments
+    table = ScheduleTable.allocate(len(num_repayments), int(num_repayments.sum()))
+    if 'loanid' in loans:
+        table.loanids = np.asarray(loans['loanid'])
+    else:
+        table.loanids = np.arange(first_row, first_row + len(num_repayments))
+    first_rows = np.cumsum(num_repayments) - num_repayments
+    batches = term_batches(num_repayments)
+    if len(batches) == 1:
+        batches = [np.arange(len(num_repayments))]
+    for rows in batches:
+        batch = loans if len(batches) == 1 else {name: np.asarray(loans[name])[rows] for name in loans}
+        schedule, amortization = _compute_batch(batch, cache, roll, curve, fixed)
+        with instrument.timer('pipeline.table'):
+            table.write(rows, first_rows[rows], schedule, amortization)
+    return table
+
+
+def _compute_batch(loans, cache, roll, curve, fixed):
+    # PortfolioSchedule and Amortization of a batch of loans
+    import numpy as np
+    from .amortization import amortize_schedule
+    from .schedule import generate_portfolio_schedule
+
+    upfrontfee = np.asarray(loans['upfrontfee'], dtype=np.float64)
+    if fixed is not None:
+        from .fixedpoint import fixed_point_schedule, to_float
+        if cache is None or curve is not None:
+            schedule = generate_portfolio_schedule(loans, roll, curve)
+        else:
+            schedule = cache.schedule(loans, roll)
+        with instrument.timer('pipeline.fixedpoint'):
+            return to_float(fixed_point_schedule(loans, schedule, upfrontfee, fixed), schedule)
+    if cache is None or curve is not None:
+        schedule = generate_portfolio_schedule(loans, roll, curve)
+        return schedule, amortize_schedule(schedule, upfrontfee)
+    schedule = cache.schedule(loans, roll)
+    return schedule, amortize_schedule(schedule, upfrontfee, eir=cache.eir(loans, roll))
+
+
+def process_chunk(loans, first_row=0, cache=None, roll='carry', curve=None, fixed=None):
+    return compute_chunk(loans, first_row, cache, roll, curve, fixed).to_pandas()
+
+
+def read_tape(path, chunksize, skip_chunks=0):
+    # chunks of a csv or parquet loan tape as DataFrames, optionally skipping the first few
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("reading parquet loan tapes requires pyarrow")
+        for i, batch in enumerate(pq.ParquetFile(path).iter_batches(batch_size=chunksize)):
+            if i >= skip_chunks:
+                yield batch.to_pandas()
+    else:
+        import pandas as pd
+        skiprows = range(1, skip_chunks * chunksize + 1) if skip_chunks else None
+        for chunk in pd.read_csv(path, chunksize=chunksize, skiprows=skiprows):
+            yield chunk
+
+
+def _read_checkpoint(checkpoint):
+    if not os.path.exists(checkpoint):
+        return None
+    with open(checkpoint) as f:
+        return json.load(f)
+
+
+def _write_checkpoint(checkpoint, state):
+    # write then rename, so a crash never leaves a half-written checkpoint
+    temporary = checkpoint + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(state, f)
+    os.replace(temporary, checkpoint)
+
+
+def run_pipeline(tape, output, chunksize=100000, checkpoint=None, resume=False, progress=None, workers=1,
+                 cache_bytes=None, roll='carry', curve=None, fixed=None, keys=()):
+    # progress, when given, is called with the running PipelineStats after each chunk;
+    # with workers > 1 the chunks are computed in a process pool and written in tape order;
+    # cache_bytes turns on a ScheduleCache of that size in every worker, curve is an optional ratecurve.RateCurve,
+    # fixed an optional fixedpoint.FixedPoint; an output ending in .parquet is written by a ParquetScheduleWriter
+    # (no checkpoint), with the tape columns in keys added as dictionary-encoded columns
+    from .runner import map_shards
+
+    if output.endswith('.parquet'):
+        if resume:
+            raise ValueError("Parquet output cannot be resumed")
+        return _run_parquet(tape, output, chunksize, progress, workers, cache_bytes, roll, curve, fixed, keys)
+    if checkpoint is None:
+        checkpoint = output + '.checkpoint'
+    state = _read_checkpoint(checkpoint) if resume else None
+    if state is None:
+        state = {'tape': os.path.abspath(tape), 'chunksize': chunksize, 'chunks': 0, 'loans': 0, 'rows': 0,
+                 'offset': 0}
+    elif state['chunksize'] != chunksize or state['tape'] != os.path.abspath(tape):
+        raise ValueError("Checkpoint was written for a different tape or chunk size")
+
+    def stats(chunk_seconds=0.0):
+        seconds = time.perf_counter() - started
+        return PipelineStats(state['chunks'], state['loans'], state['rows'], seconds,
+                             (state['rows'] - resumed_rows) / max(seconds, 1e-9), chunk_seconds)
+
+    resumed_rows = state['rows']
+    started = time.perf_counter()
+    with open(output, 'r+b' if state['chunks'] else 'wb') as out:
+        # drop anything written after the last completed chunk
+        out.truncate(state['offset'])
+        out.seek(state['offset'])
+        chunks = instrument.timed_iter('pipeline.read', read_tape(tape, chunksize, skip_chunks=state['chunks']))
+        for result in map_shards(chunks, workers, first_row=state['loans'], cache_bytes=cache_bytes,
+                                 roll=roll, curve=curve, fixed=fixed):
+            with instrument.timer('pipeline.frame'):
+                frame = result.table.to_pandas()
+            with instrument.timer('pipeline.write'):
+                out.write(frame.to_csv(index=False, header=state['offset'] == 0).encode())
+                out.flush()
+                os.fsync(out.fileno())
+            instrument.count('pipeline.chunks')
+            instrument.count('pipeline.rows', len(frame))
+
+            state['chunks'] += 1
+            state['loans'] += result.loans
+            state['rows'] += len(frame)
+            state['offset'] = out.tell()
+            _write_checkpoint(checkpoint, state)
+            if progress is not None:
+                progress(stats(result.seconds))
+    return stats()
+
+
+def _run_parquet(tape, output, chunksize, progress, workers, cache_bytes, roll, curve, fixed, keys):
+    from .parquetout import ParquetScheduleWriter
+    from .runner import map_labelled_shards
+
+    started = time.perf_counter()
+    counts = {'chunks': 0, 'loans': 0}
+    # every chunk with its key columns
+    chunks = ((chunk, {name: chunk[name].values for name in keys})
+              for chunk in instrument.timed_iter('pipeline.read', read_tape(tape, chunksize)))
+
+    def stats(chunk_seconds=0.0):
+        seconds = time.perf_counter() - started
+        return PipelineStats(counts['chunks'], counts['loans'], writer.rows, seconds,
+                             writer.rows / max(seconds, 1e-9), chunk_seconds)
+
+    with ParquetScheduleWriter(output) as writer:
+        for result, labels in map_labelled_shards(chunks, workers, cache_bytes=cache_bytes, roll=roll, curve=curve,
+                                                  fixed=fixed):
+            with instrument.timer('pipeline.write'):
+                writer.append(result.table, labels)
+            instrument.count('pipeline.chunks')
+            instrument.count('pipeline.rows', len(result.table))
+            counts['chunks'] += 1
+            counts['loans'] += result.loans
+            if progress is not None:
+                progress(stats(result.seconds))
+    return stats()
+
+
+def print_progress(stats):
+    print('chunk %d: %d loans, %d rows, %.0f rows/s, chunk computed in %.2fs'
+          % (stats.chunks, stats.loans, stats.rows, stats.rows_per_second, stats.chunk_seconds), file=sys.stderr)
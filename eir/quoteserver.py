@@ -0,0 +1,188 @@
+# asyncio quote server: concurrent quote requests are gathered into micro-batches and priced together on the
+# batch engine
+#
+# protocol: one json object per line each way over localhost tcp or a unix socket. A request carries the
+# loan_columns of generate_loan_repayment_schedule, an optional id and "schedule": true to get the repayments
+# back; the answer carries the id, the annual eir in percent, the installment and the number of repayments
+# (or an "error").
+#
+# a batch is priced once max_batch requests are waiting or max_wait seconds after its first request, whichever
+# comes first; requests queue up to max_queue, after which connections stop being read until there is room
+# again (backpressure reaches the clients through tcp flow control)
+import asyncio
+import json
+import math
+
+from .columnar import output_columns
+from .schedule import loan_columns
+
+
+def _number(value):
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _quote(table, i, schedule):
+    rows = table.loan_rows(i)
+    quote = {'eir': _number(table.eir[i]), 'repayments': int(rows.stop - rows.start),
+             'installment': _number(table['Total Payment'][rows.start]) if rows.stop > rows.start else None}
+    if schedule:
+        columns = [name for name in output_columns if name not in ('loanid', 'eir')]
+        quote['schedule'] = [
+            {name: (str(table[name][row]) if name == 'Date' else
+                    int(table[name][row]) if name == 'Period' else _number(table[name][row]))
+             for name in columns}
+            for row in range(rows.start, rows.stop)]
+    return quote
+
+
+def price(loans, schedules=None, cache=None, roll='carry'):
+    # quotes for a list of loan dicts, priced as one batch; schedules flags the loans that want their repayments.
+    # A batch with an invalid loan is priced loan by loan, so only that loan gets the error
+    from .pipeline import compute_chunk
+
+    schedules = schedules or [False] * len(loans)
+    tape = {name: [loan[name] for loan in loans] for name in loan_columns}
+    try:
+        table = compute_chunk(tape, 0, cache, roll)
+    except (ValueError, TypeError):
+        if len(loans) == 1:
+            raise
+        quotes = []
+        for loan, schedule in zip(loans, schedules):
+            try:
+                quotes.append(price([loan], [schedule], cache, roll)[0])
+            except (ValueError, TypeError) as error:
+                quotes.append({'error': str(error)})
+        return quotes
+    return [_quote(table, i, schedule) for i, schedule in enumerate(schedules)]
+
+
+class QuoteServer:
+    def __init__(self, max_batch=256, max_wait=0.002, max_queue=4096, cache_bytes=None, roll='carry'):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.roll = roll
+        self.cache = None
+        if cache_bytes is not None:
+            from .cache import ScheduleCache
+            self.cache = ScheduleCache(cache_bytes)
+        self.requests = 0
+        self.batches = 0
+        self._queue = None
+
+    def stats(self):
+        return {'requests': self.requests, 'batches': self.batches,
+                'mean_batch': self.requests / self.batches if self.batches else 0.0,
+                'queued': self._queue.qsize() if self._queue is not None else 0}
+
+    async def _collect(self):
+        # the next micro-batch: wait for one request, then take more until the batch is full or max_wait is up
+        loop = asyncio.get_event_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _price_batches(self):
+        # requests that arrive while a batch is priced (in a worker thread) make up the next batch
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self._collect()
+            loans = [loan for loan, _, _ in batch]
+            schedules = [schedule for _, schedule, _ in batch]
+            try:
+                quotes = await loop.run_in_executor(None, price, loans, schedules, self.cache, self.roll)
+            except Exception as error:
+                quotes = [{'error': str(error)}] * len(batch)
+            self.requests += len(batch)
+            self.batches += 1
+            for (_, _, future), quote in zip(batch, quotes):
+                if not future.done():
+                    future.set_result(quote)
+
+    async def _answer(self, request, writer, lock):
+        loop = asyncio.get_event_loop()
+        answer = {'id': request.get('id')}
+        missing = [name for name in loan_columns if name not in request]
+        if missing:
+            answer['error'] = 'missing ' + ', '.join(missing)
+        else:
+            future = loop.create_future()
+            # waits here while the queue is full
+            await self._queue.put((request, bool(request.get('schedule')), future))
+            answer.update(await future)
+        try:
+            line = json.dumps(answer)
+        except (TypeError, ValueError) as error:
+            line = json.dumps({'id': None, 'error': str(error)})
+        async with lock:
+            writer.write((line + '\n').encode())
+            await writer.drain()
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request is a json object")
+                except ValueError as error:
+                    async with lock:
+                        writer.write((json.dumps({'id': None, 'error': str(error)}) + '\n').encode())
+                        await writer.drain()
+                    continue
+                if request.get('stats'):
+                    async with lock:
+                        writer.write((json.dumps(self.stats()) + '\n').encode())
+                        await writer.drain()
+                    continue
+                task = asyncio.ensure_future(self._answer(request, writer, lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                # a connection reads no further while the queue is full
+                while self._queue.full():
+                    await asyncio.sleep(self.max_wait)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        # listen on a unix socket when path is given, otherwise on host:port
+        self._queue = asyncio.Queue(self.max_queue)
+        self._pricer = asyncio.ensure_future(self._price_batches())
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle, path)
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def serve_forever(self, host='127.0.0.1', port=8765, path=None):
+        server = await self.start(host, port, path)
+        async with server:
+            await server.serve_forever()
+
+
+def serve(host='127.0.0.1', port=8765, path=None, **options):
+    asyncio.run(QuoteServer(**options).serve_forever(host, port, path))
@@ -0,0 +1,38 @@
+# benchmark rate curves for floating-rate loans
+# a curve is a list of dated fixings; a floating loan pays the fixing in force at the start of each period plus
+# its margin (the optional 'margin' column of the tape, in percent), and emi loans are re-amortized over the
+# remaining repayments whenever that rate changes
+from collections import namedtuple
+
+import numpy as np
+
+# dates are datetime64[D] in ascending order, rates in percent
+RateCurve = namedtuple('RateCurve', ['dates', 'rates'])
+
+
+def rate_curve(dates, rates):
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    rates = np.asarray(rates, dtype=np.float64)
+    if len(dates) == 0 or dates.shape != rates.shape:
+        raise ValueError("A rate curve needs one rate per fixing date")
+    order = np.argsort(dates, kind='stable')
+    return RateCurve(dates[order], rates[order])
+
+
+def read_curve(path):
+    # csv with date and rate columns
+    import pandas as pd
+    fixings = pd.read_csv(path)
+    return rate_curve(fixings['date'], fixings['rate'])
+
+
+def fixings(curve, dates):
+    # rate in force on each date: the last fixing on or before it, the first fixing for earlier dates
+    position = np.searchsorted(curve.dates, dates, side='right') - 1
+    return curve.rates[np.maximum(position, 0)]
+
+
+def period_rates(curve, margin, loanstartdate, dates):
+    # loans x periods rates for loans with payment dates `dates`, each period fixed on its start date
+    starts = np.concatenate([np.asarray(loanstartdate, dtype='datetime64[D]')[:, None], dates[:, :-1]], axis=1)
+    return fixings(curve, starts) + np.asarray(margin, dtype=np.float64)[:, None]
@@ -0,0 +1,152 @@
+# multi-process portfolio runner
+# splits the loan tape into shards and computes schedules and eir columns in a process pool; shards travel to
+# the workers as dicts of numpy arrays and come back as ScheduleTables rather than DataFrames, and are merged
+# back in loan order
+import os
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from . import instrument
+from .columnar import ScheduleTable
+from .schedule import loan_columns, optional_columns
+
+# cache holds the worker's ScheduleCache statistics after the shard, None without a cache; stats the
+# instrumentation collected in a worker process (see instrument), None when computed in process
+ShardResult = namedtuple('ShardResult', ['shard', 'loans', 'table', 'seconds', 'cache', 'stats'])
+PortfolioRun = namedtuple('PortfolioRun', ['table', 'shards', 'seconds'])
+
+_dates = ('loanstartdate', 'loanenddate')
+_labels = ('repaymentfrequency', 'repaymenttype', 'interest_calculation_method', 'interest_type')
+
+
+def tape_columns(loans):
+    # compact typed arrays for a chunk of the tape: datetime64 dates, fixed-width labels, float64 amounts
+    columns = {}
+    for name in loan_columns:
+        if name in _dates:
+            columns[name] = np.asarray(loans[name], dtype='datetime64[D]')
+        elif name in _labels:
+            columns[name] = np.asarray(loans[name]).astype(str)
+        else:
+            columns[name] = np.asarray(loans[name], dtype=np.float64)
+    for name in optional_columns:
+        if name in loans:
+            columns[name] = np.asarray(loans[name]).astype(str)
+    if 'margin' in loans:
+        columns['margin'] = np.asarray(loans['margin'], dtype=np.float64)
+    if 'loanid' in loans:
+        loanid = np.asarray(loans['loanid'])
+        columns['loanid'] = loanid.astype(str) if loanid.dtype == object else loanid
+    return columns
+
+
+# one ScheduleCache per process, kept between shards
+_cache = None
+
+
+def _process_cache(cache_bytes):
+    global _cache
+    if cache_bytes is None:
+        return None
+    if _cache is None or _cache.schedules.max_bytes != cache_bytes:
+        from .cache import ScheduleCache
+        _cache = ScheduleCache(cache_bytes)
+    return _cache
+
+
+def compute_shard(shard, columns, first_row, cache_bytes=None, roll='carry', curve=None, instrumented=False,
+                  fixed=None):
+    # instrumented collects the instrumentation of a worker process and sends it back with the result
+    from .pipeline import compute_chunk
+
+    if instrumented:
+        # a forked worker inherits the parent's stats, so collect into fresh ones
+        previous = instrument.current()
+        instrument.enable()
+    started = time.perf_counter()
+    cache = _process_cache(cache_bytes)
+    try:
+        result = compute_chunk(columns, first_row, cache, roll, curve, fixed)
+    finally:
+        stats = None
+        if instrumented:
+            stats = instrument.disable().as_dict()
+            if previous is not None:
+                instrument.enable(previous)
+    return ShardResult(shard, len(columns['originalamount']), result, time.perf_counter() - started,
+                       None if cache is None else cache.stats(), stats)
+
+
+def map_shards(chunks, workers=1, first_row=0, cache_bytes=None, roll='carry', curve=None, fixed=None):
+    # compute each chunk of the tape and yield the ShardResults in tape order; with several workers at most
+    # two shards per worker are in flight, so memory stays bounded on long tapes
+    if workers <= 1:
+        for shard, chunk in enumerate(chunks):
+            columns = tape_columns(chunk)
+            yield compute_shard(shard, columns, first_row, cache_bytes, roll, curve, fixed=fixed)
+            first_row += len(columns['originalamount'])
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # worker instrumentation is merged into the parent's stats as the shards come back
+    stats = instrument.current()
+
+    def collected(result):
+        if stats is not None and result.stats is not None:
+            stats.merge(result.stats)
+        return result
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for shard, chunk in enumerate(chunks):
+            columns = tape_columns(chunk)
+            pending.append(pool.submit(compute_shard, shard, columns, first_row, cache_bytes, roll,
+                                       curve, stats is not None, fixed))
+            first_row += len(columns['originalamount'])
+            if len(pending) >= 2 * workers:
+                yield collected(pending.popleft().result())
+        while pending:
+            yield collected(pending.popleft().result())
+
+
+def map_labelled_shards(labelled_chunks, workers=1, **options):
+    # map_shards over (chunk, label) pairs, yielding each ShardResult with its chunk's label (segment labels, key
+    # columns, fingerprints), which waits in order until map_shards hands back the chunk's schedules
+    labels = deque()
+
+    def chunks():
+        for chunk, label in labelled_chunks:
+            labels.append(label)
+            yield chunk
+
+    for result in map_shards(chunks(), workers, **options):
+        yield result, labels.popleft()
+
+
+def split_tape(loans, chunksize):
+    # row slices of an in-memory tape (DataFrame or mapping of columns)
+    total = len(np.asarray(loans['originalamount']))
+    for start in range(0, total, chunksize):
+        if hasattr(loans, 'iloc'):
+            yield loans.iloc[start:start + chunksize]
+        else:
+            yield {name: np.asarray(values)[start:start + chunksize] for name, values in loans.items()}
+
+
+def run_portfolio(loans, workers=None, chunksize=10000, cache_bytes=None, roll='carry', curve=None):
+    # schedules and eir columns for a whole in-memory tape, merged in loan order; the result does not depend
+    # on the number of workers or the chunk size
+    if workers is None:
+        workers = os.cpu_count() or 1
+    started = time.perf_counter()
+    results = list(map_shards(split_tape(loans, chunksize), workers, cache_bytes=cache_bytes, roll=roll,
+                              curve=curve))
+    if results:
+        table = ScheduleTable.concatenate([result.table for result in results])
+    else:
+        table = ScheduleTable.allocate(0, 0)
+    shards = [result._replace(table=None) for result in results]
+    return PortfolioRun(table, shards, time.perf_counter() - started)
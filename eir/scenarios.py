@@ -0,0 +1,161 @@
+# rate-shock scenarios: eir, amortized fee and carrying amount of every loan under parallel shocks of the
+# contractual rate
+# the terms, payment calendar, as-of position and interest accrual of a chunk of loans are worked out once, with an
+# unshocked run of every loan; a shock then only reruns the loans it touches, every scenario a column of loans x
+# scenarios arrays that go through the period recursion and the eir solve together in batches of similar term, the
+# solve starting from the unshocked eir moved by the shock
+#
+# under a shock, variable-rate loans pay the shocked rate from origination (emi re-amortized at that rate) and the
+# eir is solved against the same carrying amount (amount less fee); flat-rate loans are not affected
+from collections import namedtuple
+
+import numpy as np
+
+from .eirsolver import solve_cashflow_eir
+from .paycalendar import payment_calendar
+from .pipeline import batch_rows, term_batches
+from .schedule import parse_loan_terms
+
+# shocks in basis points; eir (annual percent), amortizedfee (fee recognised up to the as-of date) and carrying
+# (amortized cost after the repayments up to the as-of date) are loans x scenarios
+ScenarioResult = namedtuple('ScenarioResult', ['shocks', 'eir', 'amortizedfee', 'carrying'])
+
+default_shocks = (-200, -100, -50, 0, 50, 100, 200)
+
+
+class ScenarioEngine:
+    # loans is a chunk of the tape, asof the reporting date; floor is the lowest shocked rate in percent
+    # (None for no floor)
+    def __init__(self, loans, asof, roll='carry', floor=0.0):
+        if 'margin' in loans and np.isfinite(np.asarray(loans['margin'], dtype=np.float64)).any():
+            raise ValueError("Rate shocks of loans floating on a curve are not supported")
+        terms = parse_loan_terms(loans)
+        calendar = payment_calendar(terms.loanstartdate, terms.repayment_interval, terms.num_repayments,
+                                    terms.daycount, roll)
+        self.terms = terms
+        self.floor = floor
+        self.upfrontfee = np.asarray(loans['upfrontfee'], dtype=np.float64)
+        # repayments made on or before the as-of date
+        self.paid = np.count_nonzero(calendar.dates <= np.datetime64(asof, 'D'), axis=1)
+        # periods x loans interest per unit of balance and percent of rate, the part of the recursion no shock
+        # changes, periods first so every period is read as one contiguous block
+        with np.errstate(divide='ignore', invalid='ignore'):
+            accrual = np.where(terms.monthly[:, None], (terms.repayment_interval / 12)[:, None],
+                               calendar.days / terms.base_days[:, None]) / 100
+        self.accrual = np.ascontiguousarray(accrual.T)
+        # the unshocked run of every loan: the result of the loans no shock touches (flat rate) and the starting
+        # point of the eir solve of the others, which their shocked cash flows move by little
+        self.base = self._solve(np.arange(len(self.paid)), terms.interestrate[:, None])
+        self.shocked = np.flatnonzero(~terms.flatrate)
+
+    def cashflows(self, rows, rates):
+        # periods x loans x scenarios cash flows of the loans rows at their loans x scenarios rates (percent), and
+        # the contractual balance after the repayments made by the as-of date
+        terms = self.terms
+        n = terms.num_repayments[rows]
+        num_periods = int(n.max()) if len(rows) else 0
+        emi = terms.emi[rows, None]
+        flatrate = terms.flatrate[rows]
+        originalamount = terms.originalamount[rows, None]
+        paid = self.paid[rows, None]
+        accrual = self.accrual[:num_periods, rows]
+        active = np.arange(num_periods)[:, None] < n
+
+        factor = np.where(terms.monthly[rows, None], rates / 100 / 12, rates / 100 / terms.base_days[rows, None])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            principal_per_installment = originalamount / n[:, None]
+            installment = np.where(factor == 0, principal_per_installment,
+                                   originalamount * (factor / (1 - (1 + factor) ** -n[:, None])))
+        # an emi repays the installment less the interest, an fpi the same principal every period
+        level = np.where(emi, installment, principal_per_installment)
+        flat_interest = rates / 100 * originalamount
+
+        flows = np.empty((num_periods,) + rates.shape)
+        balance = np.broadcast_to(originalamount, rates.shape).copy()
+        settled = balance.copy()
+        for k in range(num_periods):
+            interest_payment = rates * accrual[k, :, None] * balance
+            if flatrate.any():
+                interest_payment = np.where(flatrate[:, None], flat_interest, interest_payment)
+            principal_payment = (level - emi * interest_payment) * active[k, :, None]
+            np.add(principal_payment, interest_payment, out=flows[k])
+            balance -= principal_payment
+            if k < paid.max():
+                settled = np.where(paid == k + 1, balance, settled)
+        flows[~active] = np.nan
+        return flows, settled
+
+    def _run(self, rows, rates, guess=None):
+        # periodic eir, amortized fee and carrying amount of the loans rows at loans x scenarios rates
+        flows, settled = self.cashflows(rows, rates)
+        num_periods = len(flows)
+        num_loans, num_scenarios = rates.shape
+        n = self.terms.num_repayments[rows, None]
+        paid = self.paid[rows, None]
+        carrying_amount = (self.terms.originalamount - self.upfrontfee)[rows, None]
+        eir = solve_cashflow_eir(flows.reshape(num_periods, num_loans * num_scenarios).T,
+                                 np.repeat(carrying_amount, num_scenarios),
+                                 guess=None if guess is None else guess.ravel()).rate
+        eir = eir.reshape(num_loans, num_scenarios)
+
+        # the carrying amount after the repayments made is what is left of the cash flows discounted at the eir,
+        # rebuilt backward from the last repayment like amortization.amortize; the fee amortized so far is what it
+        # closed of the fee, the gap between the two balances
+        growth = 1 + eir
+        carrying = np.zeros(rates.shape)
+        for k in range(num_periods - 1, int(paid.min()) - 1 if num_loans else num_periods, -1):
+            carrying = np.where((k >= paid) & (k < n), (carrying + flows[k]) / growth, carrying)
+        opening = paid == 0
+        carrying = np.where(opening, carrying_amount, carrying)
+        amortizedfee = np.where(opening, 0.0, self.upfrontfee[rows, None] - (settled - carrying))
+        return eir, amortizedfee, carrying
+
+    def _solve(self, rows, rates, guess=None):
+        # _run over batches of loans of similar term, so the recursion and the eir solve of each batch stop at its
+        # longest loan rather than the chunk's
+        results = tuple(np.empty(rates.shape) for _ in range(3))
+        for batch in term_batches(self.terms.num_repayments[rows], max(batch_rows // rates.shape[1], 1)):
+            values = self._run(rows[batch], rates[batch], None if guess is None else guess[batch])
+            for result, value in zip(results, values):
+                result[batch] = value
+        return results
+
+    def evaluate(self, shocks=default_shocks):
+        shocks = np.asarray(shocks, dtype=np.float64)
+        terms = self.terms
+        # only the loans the shock touches are run again, each scenario a column of them
+        eir, amortizedfee, carrying = (np.repeat(values, len(shocks), axis=1) for values in self.base)
+        rows = self.shocked
+        if len(rows) and len(shocks):
+            rates = terms.interestrate[rows, None] + shocks[None, :] / 100
+            if self.floor is not None:
+                rates = np.maximum(rates, self.floor)
+            # a shock moves the eir by about as much as it moves the periodic rate of the cash flows (the installment
+            # factor of an emi, the interest of a period of an fpi), which leaves newton a step or two
+            per_percent = np.where(terms.emi, np.where(terms.monthly, 1 / 12, 1 / terms.base_days),
+                                   terms.repayment_interval / 12)[rows, None] / 100
+            guess = self.base[0][rows] + (rates - terms.interestrate[rows, None]) * per_percent
+            eir[rows], amortizedfee[rows], carrying[rows] = self._solve(rows, rates, guess)
+        annual = eir * 100 * (12 // terms.repayment_interval)[:, None]
+        return ScenarioResult(shocks, annual, amortizedfee, carrying)
+
+
+def shock_tape(tape, asof, shocks=default_shocks, chunksize=5000, roll='carry', floor=0.0):
+    # one row per loan: loanid and the eir, amortized fee and carrying amount of every scenario, chunk by chunk
+    import pandas as pd
+    from .pipeline import read_tape
+
+    labels = ['%+gbp' % shock for shock in shocks]
+    if len(set(labels)) < len(labels):
+        raise ValueError("Duplicate shocks")
+    first_row = 0
+    for chunk in read_tape(tape, chunksize):
+        result = ScenarioEngine(chunk, asof, roll, floor).evaluate(shocks)
+        loanid = chunk['loanid'].values if 'loanid' in chunk else np.arange(first_row, first_row + len(chunk))
+        columns = {'loanid': loanid}
+        for name in ('eir', 'amortizedfee', 'carrying'):
+            values = getattr(result, name)
+            for j, label in enumerate(labels):
+                columns['%s_%s' % (name, label)] = values[:, j]
+        first_row += len(chunk)
+        yield pd.DataFrame(columns)
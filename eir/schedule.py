@@ -0,0 +1,226 @@
+# batch loan repayment schedules
+# builds the schedules of a whole loan tape at once as loans x periods numpy arrays,
+# using the same rules as generate_loan_repayment_schedule in finaleir.py
+from collections import namedtuple
+
+import numpy as np
+
+from . import instrument
+from .paycalendar import daycounts, payment_calendar
+
+# Define repayment intervals in months
+intervals = {
+    'monthly': 1,
+    'termly': 4,
+    'quarterly': 3,
+    'bi-annually': 6,
+    'yearly': 12,
+}
+
+# columns expected on the loan tape (same names as the arguments of generate_loan_repayment_schedule)
+loan_columns = ['loanstartdate', 'loanenddate', 'originalamount', 'repaymentfrequency', 'interestrate',
+                'upfrontfee', 'repaymenttype', 'interest_calculation_method', 'base_days', 'interest_type']
+
+# optional tape columns: daycount ('ACT/365', 'ACT/360' or '30/360') overrides base_days for daily interest
+optional_columns = ['daycount']
+
+
+class PortfolioSchedule:
+    # loans x periods arrays, periods past a loan's last repayment are NaN (NaT for dates)
+    def __init__(self, dates, principal, interest, total_payment, running_balance, num_repayments,
+                 repayment_interval, installment, days_in_period):
+        self.dates = dates
+        self.principal = principal
+        self.interest = interest
+        self.total_payment = total_payment
+        self.running_balance = running_balance
+        self.num_repayments = num_repayments
+        self.repayment_interval = repayment_interval
+        self.installment = installment
+        self.days_in_period = days_in_period
+
+    def __len__(self):
+        return len(self.num_repayments)
+
+    @property
+    def num_periods(self):
+        return self.principal.shape[1]
+
+    def period_mask(self):
+        # True where the period exists for the loan
+        return np.arange(self.num_periods) < self.num_repayments[:, None]
+
+    def loan_frame(self, i):
+        # one loan's schedule laid out like generate_loan_repayment_schedule returns it
+        import pandas as pd
+        n = self.num_repayments[i]
+        return pd.DataFrame({
+            'Date': self.dates[i, :n].astype('datetime64[ns]'),
+            'Principal': self.principal[i, :n],
+            'Interest': self.interest[i, :n],
+            'Total Payment': self.total_payment[i, :n],
+            'Running Balance': self.running_balance[i, :n],
+        })
+
+
+def _column(loans, name, dtype=None):
+    return np.asarray(loans[name], dtype=dtype)
+
+
+def _lookup(values, table, message):
+    # map an array of labels through a dict, raising like the scalar code does
+    out = np.empty(len(values), dtype=np.int64)
+    for label in np.unique(values):
+        if label not in table:
+            raise ValueError(message)
+        out[values == label] = table[label]
+    return out
+
+
+# validated loan terms as arrays, one entry per loan
+LoanTerms = namedtuple('LoanTerms', ['loanstartdate', 'originalamount', 'interestrate', 'base_days',
+                                     'daycount', 'repayment_interval', 'num_repayments', 'emi', 'monthly',
+                                     'flatrate', 'interest_rate_factor'])
+
+
+def parse_loan_terms(loans):
+    # loans is a DataFrame (or any mapping of column -> array) with the loan_columns above
+    loanstartdate = _column(loans, 'loanstartdate', 'datetime64[D]')
+    loanenddate = _column(loans, 'loanenddate', 'datetime64[D]')
+    originalamount = _column(loans, 'originalamount', np.float64)
+    interestrate = _column(loans, 'interestrate', np.float64)
+    base_days = _column(loans, 'base_days', np.float64)
+    repaymenttype = _column(loans, 'repaymenttype').astype(str)
+    interest_calculation_method = _column(loans, 'interest_calculation_method').astype(str)
+    interest_type = _column(loans, 'interest_type').astype(str)
+
+    # Calculate the number of months between start and end dates
+    num_months = (loanenddate.astype('datetime64[M]') - loanstartdate.astype('datetime64[M]')).astype(np.int64)
+
+    repayment_interval = _lookup(_column(loans, 'repaymentfrequency').astype(str), intervals,
+                                 "Invalid repayment frequency")
+
+    # Calculate the number of repayments
+    num_repayments = np.maximum(num_months // repayment_interval, 0)
+
+    # Determine the appropriate interest rate factor based on interest calculation method
+    monthly = interest_calculation_method == 'monthly'
+    daily = interest_calculation_method == 'daily'
+    if not np.all(monthly | daily):
+        raise ValueError("Invalid interest calculation method")
+    if 'daycount' in loans:
+        daycount = _column(loans, 'daycount').astype(str)
+        base_days = _lookup(daycount, daycounts, "Invalid day count convention").astype(np.float64)
+    else:
+        if np.any(daily & (base_days != 365) & (base_days != 360)):
+            raise ValueError("Invalid base days value")
+        daycount = np.where(base_days == 360, 'ACT/360', 'ACT/365')
+    interest_rate_factor = np.where(monthly, interestrate / 100 / 12, interestrate / 100 / base_days)
+
+    emi = repaymenttype == 'emi'
+    if not np.all(emi | (repaymenttype == 'fpi')):
+        raise ValueError("Invalid repayment type")
+
+    flatrate = interest_type == 'flatrate'
+    if not np.all(flatrate | (interest_type == 'variable')):
+        raise ValueError("Invalid interest type")
+
+    return LoanTerms(loanstartdate, originalamount, interestrate, base_days, daycount, repayment_interval,
+                     num_repayments, emi, monthly, flatrate, interest_rate_factor)
+
+
+def _installment(balance, interest_rate_factor, remaining):
+    # emi that pays off balance in the remaining repayments
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(interest_rate_factor == 0, balance / remaining,
+                        balance * (interest_rate_factor / (1 - (1 + interest_rate_factor) ** -remaining)))
+
+
+def generate_portfolio_schedule(loans, roll='carry', curve=None):
+    # loans is a DataFrame (or any mapping of column -> array) with the loan_columns above;
+    # roll is how payment dates move from month to month (see paycalendar.rolls);
+    # curve is an optional ratecurve.RateCurve that variable-rate loans float on, at the tape's margin column
+    # (0 without one; loans with a NaN margin keep their fixed interestrate)
+    with instrument.timer('schedule.terms'):
+        terms = parse_loan_terms(loans)
+    originalamount = terms.originalamount
+    interestrate = terms.interestrate
+    base_days = terms.base_days
+    repayment_interval = terms.repayment_interval
+    num_repayments = terms.num_repayments
+    interest_rate_factor = terms.interest_rate_factor
+    emi, monthly, flatrate = terms.emi, terms.monthly, terms.flatrate
+
+    num_periods = int(num_repayments.max()) if len(num_repayments) else 0
+    with instrument.timer('schedule.calendar'):
+        # an anchor_day column (see paycalendar) keeps a restarted eom schedule on its original payment day
+        anchor_day = _column(loans, 'anchor_day', np.int64) if 'anchor_day' in loans else None
+        calendar = payment_calendar(terms.loanstartdate, repayment_interval, num_repayments, terms.daycount, roll,
+                                    anchor_day=anchor_day)
+    dates, days_in_period = calendar.dates, calendar.days
+
+    # floating loans take their rate per period from the curve
+    rates = None
+    if curve is not None:
+        from .ratecurve import period_rates
+        margin = _column(loans, 'margin', np.float64) if 'margin' in loans else np.zeros(len(originalamount))
+        floating = ~flatrate & ~np.isnan(margin)
+        if floating.any():
+            rates = np.where(floating[:, None],
+                             period_rates(curve, np.where(floating, margin, 0.0), terms.loanstartdate, dates),
+                             interestrate[:, None])
+            interestrate = rates[:, 0] if num_periods else interestrate
+            interest_rate_factor = np.where(monthly, interestrate / 100 / 12, interestrate / 100 / base_days)
+
+    # Calculate the repayment amount per installment based on repayment type
+    with np.errstate(divide='ignore', invalid='ignore'):
+        principal_per_installment = originalamount / num_repayments
+    total_payment_per_installment = np.where(emi, _installment(originalamount, interest_rate_factor,
+                                                               num_repayments), np.nan)
+    installment = total_payment_per_installment if rates is None else total_payment_per_installment.copy()
+
+    shape = (len(originalamount), num_periods)
+    principal = np.empty(shape)
+    interest = np.empty(shape)
+    running_balance = np.empty(shape)
+
+    # Generate the repayment schedule, one period at a time for every loan
+    with instrument.timer('schedule.periods'):
+        flat_interest = interestrate / 100 * originalamount
+        monthly_rate = interestrate / 100 / 12
+        daily_rate = interestrate / 100 / base_days
+        balance = originalamount.copy()
+        for k in range(num_periods):
+            if rates is not None and k:
+                monthly_rate = rates[:, k] / 100 / 12
+                daily_rate = rates[:, k] / 100 / base_days
+                # re-amortize the emi of every loan whose rate resets at this period
+                reset = np.flatnonzero((rates[:, k] != rates[:, k - 1]) & emi & (k < num_repayments))
+                if len(reset):
+                    factor = np.where(monthly[reset], monthly_rate[reset], daily_rate[reset])
+                    installment[reset] = _installment(balance[reset], factor, num_repayments[reset] - k)
+            if flatrate.all():
+                interest_payment = flat_interest
+            else:
+                interest_payment = np.where(monthly, monthly_rate * balance * repayment_interval,
+                                            daily_rate * days_in_period[:, k] * balance)
+                interest_payment = np.where(flatrate, flat_interest, interest_payment)
+            principal_payment = np.where(emi, installment - interest_payment,
+                                         principal_per_installment)
+            # loans that are already paid off keep their balance, so the padding never overflows
+            principal_payment = np.where(k < num_repayments, principal_payment, 0.0)
+            principal[:, k] = principal_payment
+            interest[:, k] = interest_payment
+            running_balance[:, k] = balance
+            balance = balance - principal_payment
+    total_payment = interest + principal
+
+    # blank out the periods after each loan's last repayment
+    outside = np.arange(num_periods) >= num_repayments[:, None]
+    for values in (principal, interest, total_payment, running_balance):
+        values[outside] = np.nan
+
+    instrument.count('schedule.loans', len(num_repayments))
+    instrument.count('schedule.periods', int(num_repayments.sum()))
+    return PortfolioSchedule(dates, principal, interest, total_payment, running_balance, num_repayments,
+                             repayment_interval, total_payment_per_installment, days_in_period)
@@ -0,0 +1,283 @@
+# binary schedule store with random access by loan and period
+# a directory of fixed-width column files opened with numpy.memmap, so a query touches only the pages it reads:
+#
+#   meta.json            loans, rows and the dtype of every column; written last, so it always describes
+#                        complete data
+#   rows/<column>.bin    one value per repayment, grouped by loan: loan, period, date and the amount columns
+#   loans/<column>.bin   one value per loan: loanid, eir, fingerprint (of the loan's terms, 0 when unknown, see
+#                        delta), live (0 once removed) and offset, the first row of the loan (with a final entry
+#                        for the total row count, so loan i is rows offset[i]:offset[i + 1])
+#
+# runs are added with append(); a loanid that is appended again is answered from its latest run, and remove()
+# takes loanids out of the answers without rewriting their rows
+import json
+import os
+
+import numpy as np
+
+from .columnar import ScheduleTable, amount_columns
+
+_format = 2
+
+_row_dtypes = [('loan', '<i4'), ('period', '<i4'), ('date', '<M8[D]')] + [(name, '<f8') for name in amount_columns]
+
+
+def _file_name(column):
+    return column.replace(' ', '_') + '.bin'
+
+
+class ScheduleStore:
+    def __init__(self, path, mode='r'):
+        # mode 'r' opens an existing store read-only, 'a' opens or creates one for appending
+        if mode not in ('r', 'a'):
+            raise ValueError("Invalid store mode")
+        self.path = path
+        self.mode = mode
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            if mode == 'r':
+                raise FileNotFoundError("No schedule store at %s" % path)
+            os.makedirs(os.path.join(path, 'rows'), exist_ok=True)
+            os.makedirs(os.path.join(path, 'loans'), exist_ok=True)
+            self.meta = {'format': _format, 'loans': 0, 'rows': 0, 'loanid': '<U1',
+                         'rows_dtypes': dict(_row_dtypes)}
+            self._write_meta()
+        else:
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta['format'] != _format:
+                raise ValueError("Unsupported schedule store format")
+        self._load()
+
+    def _write_meta(self):
+        # write then rename, so readers never see a half-written meta.json
+        temporary = os.path.join(self.path, 'meta.json.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(temporary, os.path.join(self.path, 'meta.json'))
+
+    def _map(self, folder, column, dtype, length):
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, folder, _file_name(column)), dtype=dtype, mode='r',
+                         shape=(length,))
+
+    def _load(self):
+        loans, rows = self.meta['loans'], self.meta['rows']
+        self.rows = {name: self._map('rows', name, dtype, rows) for name, dtype in self.meta['rows_dtypes'].items()}
+        self.loanids = self._map('loans', 'loanid', self.meta['loanid'], loans)
+        self.eir = self._map('loans', 'eir', '<f8', loans)
+        self.fingerprints = self._map('loans', 'fingerprint', '<u8', loans)
+        self.live = self._map('loans', 'live', '|u1', loans)
+        self.offsets = self._map('loans', 'offset', '<i8', loans + 1) if loans else np.zeros(1, dtype=np.int64)
+        # loanid lookups go through a stable sort, so the latest run of a loanid sorts last
+        self._order = np.argsort(self.loanids, kind='stable')
+
+    def __len__(self):
+        return self.meta['loans']
+
+    @property
+    def num_rows(self):
+        return self.meta['rows']
+
+    def _append_file(self, folder, column, values, length):
+        # drop anything past the committed length (left by an interrupted append) before adding values
+        path = os.path.join(self.path, folder, _file_name(column))
+        with open(path, 'ab') as f:
+            f.truncate(length * values.dtype.itemsize)
+            values.tofile(f)
+
+    def append(self, table, fingerprints=None):
+        # add the loans of a ScheduleTable (one run or chunk) after the ones already stored, with the fingerprints
+        # of their terms when known
+        if self.mode != 'a':
+            raise ValueError("Schedule store is read-only")
+        loans, rows = self.meta['loans'], self.meta['rows']
+        # loanids are stored as fixed-width text; wider ids than the store holds rewrite the (per loan, so small)
+        # id column at the new width
+        loanids = np.asarray(table.loanids).astype(str)
+        stored = np.dtype(self.meta['loanid'])
+        if loanids.dtype.itemsize > stored.itemsize:
+            stored = loanids.dtype
+            if loans:
+                self._rewrite_loanids(np.asarray(self.loanids).astype(stored))
+        loanids = loanids.astype(stored)
+
+        row_values = {'loan': (table.loan + loans).astype('<i4'), 'period': table.period.astype('<i4'),
+                      'date': table.date.astype('<M8[D]')}
+        for i, name in enumerate(amount_columns):
+            row_values[name] = np.ascontiguousarray(table.amounts[i], dtype='<f8')
+        for name, dtype in self.meta['rows_dtypes'].items():
+            self._append_file('rows', name, row_values[name].astype(dtype, copy=False), rows)
+
+        starts = rows + np.searchsorted(table.loan, np.arange(len(loanids)))
+        offsets = np.append(starts, rows + len(table)).astype('<i8')
+        self._append_file('loans', 'loanid', loanids, loans)
+        self._append_file('loans', 'eir', np.asarray(table.eir, dtype='<f8'), loans)
+        if fingerprints is None:
+            fingerprints = np.zeros(len(loanids), dtype='<u8')
+        self._append_file('loans', 'fingerprint', np.asarray(fingerprints, dtype='<u8'), loans)
+        self._append_file('loans', 'live', np.ones(len(loanids), dtype='|u1'), loans)
+        # the final offset entry of the previous append is replaced by the first start of this one
+        self._append_file('loans', 'offset', offsets, loans)
+
+        self.meta['loanid'] = stored.str
+        self.meta['loans'] = loans + len(loanids)
+        self.meta['rows'] = rows + len(table)
+        self._write_meta()
+        self._load()
+
+    def _rewrite(self, column, values):
+        path = os.path.join(self.path, 'loans', _file_name(column))
+        temporary = path + '.tmp'
+        values.tofile(temporary)
+        os.replace(temporary, path)
+
+    def _rewrite_loanids(self, loanids):
+        self._rewrite('loanid', loanids)
+        self.meta['loanid'] = loanids.dtype.str
+        self._write_meta()
+        self._load()
+
+    def remove(self, loanids):
+        # take loanids out of the store (their rows stay on disk until the store is rebuilt); returns how many
+        # were there
+        if self.mode != 'a':
+            raise ValueError("Schedule store is read-only")
+        positions = self.positions(loanids)
+        positions = positions[positions >= 0]
+        if len(positions):
+            live = np.array(self.live)
+            live[positions] = 0
+            self._rewrite('live', live)
+            self._load()
+        return len(positions)
+
+    def positions(self, loanids):
+        # positions of an array of loanids (their latest runs), -1 for loanids not in the store or removed
+        loanids = np.asarray(loanids).astype(str)
+        if not len(self):
+            return np.full(len(loanids), -1, dtype=np.int64)
+        end = np.searchsorted(self.loanids, loanids, side='right', sorter=self._order)
+        positions = self._order[np.maximum(end - 1, 0)]
+        found = (end > 0) & (self.loanids[positions] == loanids)
+        found[found] = self.live[positions[found]] != 0
+        return np.where(found, positions, -1)
+
+    def position(self, loanid):
+        # position of a loanid in the store (its latest run)
+        position = int(self.positions([loanid])[0])
+        if position < 0:
+            raise KeyError(str(loanid))
+        return position
+
+    def live_loanids(self):
+        # the loanids the store answers for, each once
+        latest = np.zeros(len(self), dtype=bool)
+        if len(self):
+            order = self._order
+            last = np.append(self.loanids[order[1:]] != self.loanids[order[:-1]], True)
+            latest[order[last]] = True
+        return np.asarray(self.loanids[latest & (self.live != 0)])
+
+    def loan_rows(self, position):
+        return slice(int(self.offsets[position]), int(self.offsets[position + 1]))
+
+    def table(self, loans=None):
+        # ScheduleTable over a slice of loan positions (all loans by default), backed by the memory maps
+        loans = slice(0, len(self)) if loans is None else loans
+        start, stop, _ = loans.indices(len(self))
+        stop = max(start, stop)
+        rows = slice(int(self.offsets[start]), int(self.offsets[stop]))
+        return ScheduleTable(self.loanids[start:stop], self.eir[start:stop], self.rows['loan'][rows] - start,
+                             self.rows['period'][rows], self.rows['date'][rows],
+                             np.stack([self.rows[name][rows] for name in amount_columns]))
+
+    def take(self, positions):
+        # ScheduleTable of the loans at an array of positions, in that order
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = np.asarray(self.offsets[positions])
+        counts = np.asarray(self.offsets[positions + 1]) - starts
+        loan = np.repeat(np.arange(len(positions), dtype=np.int32), counts)
+        rows = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+        return ScheduleTable(np.asarray(self.loanids[positions]), np.asarray(self.eir[positions]), loan,
+                             self.rows['period'][rows], self.rows['date'][rows],
+                             np.stack([self.rows[name][rows] for name in amount_columns]))
+
+    def loan(self, loanid, periods=None):
+        # one loan's rows as a ScheduleTable, optionally only a slice of its periods (period 1 is index 0)
+        position = self.position(loanid)
+        rows = self.loan_rows(position)
+        if periods is not None:
+            start, stop, _ = periods.indices(rows.stop - rows.start)
+            rows = slice(rows.start + start, rows.start + max(start, stop))
+        return ScheduleTable(self.loanids[position:position + 1], self.eir[position:position + 1],
+                             np.zeros(rows.stop - rows.start, dtype=np.int32), self.rows['period'][rows],
+                             self.rows['date'][rows], np.stack([self.rows[name][rows] for name in amount_columns]))
+
+    def value(self, loanid, period, column):
+        # a single amount, e.g. value('L1', 37, 'eirrunningbalance')
+        rows = self.loan_rows(self.position(loanid))
+        if not 1 <= period <= rows.stop - rows.start:
+            raise IndexError("Loan %s has no period %d" % (loanid, period))
+        if column == 'eir':
+            return float(self.eir[self.position(loanid)])
+        return self.rows[column][rows.start + period - 1]
+
+
+def _carrying_amounts(loan, period, total_payment, eirinterest):
+    # eirrunningbalance rebuilt from the end of each loan, where the carrying amount is fully amortized:
+    # carrying amount of period k = sum over periods j >= k of (cash flow - eir interest)
+    num_loans = int(loan.max()) + 1 if len(loan) else 0
+    matrix = np.zeros((num_loans, int(period.max()) if len(period) else 0))
+    matrix[loan, period - 1] = total_payment - eirinterest
+    remaining = np.cumsum(matrix[:, ::-1], axis=1)[:, ::-1]
+    return remaining[loan, period - 1]
+
+
+def _table_from_frame(frame):
+    # ScheduleTable from the csv layout the pipeline writes (one loan's repayments after another)
+    ids = np.asarray(frame['loanid'].values).astype(str)
+    first = np.concatenate([[True], ids[1:] != ids[:-1]]) if len(ids) else np.zeros(0, dtype=bool)
+    loan = (np.cumsum(first) - 1).astype(np.int32)
+    loanids = ids[first]
+
+    table = ScheduleTable.allocate(len(loanids), len(frame))
+    table.loanids = loanids
+    table.loan[:] = loan
+    table.period[:] = frame['Period'].values
+    table.date[:] = np.asarray(frame['Date'].values, dtype='datetime64[D]')
+    for i, name in enumerate(amount_columns):
+        table.amounts[i] = frame[name].values if name in frame else np.nan
+    if 'eirrunningbalance' not in frame and 'eirinterest' in frame:
+        table.amounts[amount_columns.index('eirrunningbalance')] = _carrying_amounts(
+            loan, table.period, frame['Total Payment'].values, frame['eirinterest'].values)
+    eir = frame['eir'].values if 'eir' in frame else np.full(len(frame), np.nan)
+    table.eir = np.full(len(loanids), np.nan)
+    table.eir[loan] = eir
+    return table
+
+
+def csv_to_store(csv_path, store_path, chunksize=1000000):
+    # appends a schedule csv to a store: the pipeline layout (loanid, Period, ...), or a single loan's
+    # schedule as the scripts write it (no loanid: the file name is used, periods are counted from 1)
+    import pandas as pd
+    store = ScheduleStore(store_path, 'a')
+    loanid = os.path.splitext(os.path.basename(csv_path))[0]
+    pending = None
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        if 'loanid' not in chunk:
+            chunk = chunk.assign(loanid=loanid)
+        if 'Period' not in chunk:
+            chunk = chunk.assign(Period=np.arange(len(chunk)) + 1 + (0 if pending is None else len(pending)))
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        # a loan can run over the chunk boundary, so its rows wait for the next chunk
+        last = chunk['loanid'].values[-1]
+        tail = chunk['loanid'].values == last
+        pending = chunk[tail]
+        if (~tail).any():
+            store.append(_table_from_frame(chunk[~tail].reset_index(drop=True)))
+    if pending is not None and len(pending):
+        store.append(_table_from_frame(pending.reset_index(drop=True)))
+    return store
@@ -0,0 +1,42 @@
+# shared fixtures: small loan tapes mixing every frequency, repayment type, interest method, base days and interest
+# type, like benchmarks/portfolio.py but with short terms so the per-loan scripts stay quick
+import numpy as np
+import pandas as pd
+import pytest
+
+frequencies = ['monthly', 'quarterly', 'termly', 'bi-annually', 'yearly']
+
+
+def loan_tape(num_loans, seed=0, max_years=5):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2019-01-01') + rng.integers(0, 6 * 365, num_loans).astype('timedelta64[D]')
+    years = rng.integers(1, max_years + 1, num_loans)
+    months = start.astype('datetime64[M]') + (years * 12).astype('timedelta64[M]')
+    day = start - start.astype('datetime64[M]').astype('datetime64[D]')
+    end = np.minimum(months.astype('datetime64[D]') + day, (months + 1).astype('datetime64[D]') - 1)
+    amount = np.round(np.exp(rng.normal(9, 1, num_loans)), 2)
+    return pd.DataFrame({
+        'loanid': ['L%d' % i for i in range(num_loans)],
+        'loanstartdate': start.astype(str),
+        'loanenddate': end.astype(str),
+        'originalamount': amount,
+        'repaymentfrequency': rng.choice(frequencies, num_loans),
+        'interestrate': np.round(rng.uniform(2, 25, num_loans), 2),
+        'upfrontfee': np.round(amount * rng.uniform(0, 0.03, num_loans), 2),
+        'repaymenttype': rng.choice(['emi', 'fpi'], num_loans),
+        'interest_calculation_method': rng.choice(['monthly', 'daily'], num_loans),
+        'base_days': rng.choice([360, 365], num_loans),
+        'interest_type': rng.choice(['variable', 'flatrate'], num_loans, p=[0.8, 0.2]),
+    })
+
+
+@pytest.fixture(scope='session')
+def tape():
+    return loan_tape(300, seed=7)
+
+
+@pytest.fixture
+def tape_csv(tape, tmp_path):
+    path = str(tmp_path / 'loans.csv')
+    tape.to_csv(path, index=False)
+    return path
@@ -0,0 +1,36 @@
+import numpy as np
+
+from eir.amortization import amortize, amortize_schedule, fee_residual
+from eir.cache import ScheduleCache
+from eir.schedule import generate_portfolio_schedule
+
+
+def test_amortized_fee_reconciles(tape):
+    # the fee amortized over a loan is its upfront fee less what the schedule leaves unpaid, and the carrying amount
+    # starts at the amount less fee and runs down to nothing after the last repayment
+    schedule = generate_portfolio_schedule(tape)
+    fee = tape['upfrontfee'].values
+    amortization = amortize_schedule(schedule, fee)
+    assert amortization.converged.all()
+    scale = np.maximum(1.0, tape['originalamount'].values)
+    assert (fee_residual(schedule, amortization, fee) <= 1e-9 * scale).all()
+    np.testing.assert_allclose(amortization.eirrunningbalance[:, 0], tape['originalamount'].values - fee)
+    last = np.arange(len(tape)), schedule.num_repayments - 1
+    closing = amortization.eirrunningbalance[last] + amortization.eirinterest[last] - schedule.total_payment[last]
+    assert (np.abs(closing) <= 1e-9 * scale).all()
+
+
+def test_high_eir_reconciles():
+    # rolling forward would compound the solver's residual by (1 + eir) ** k on a loan like this one
+    cashflows = np.array([[5000.0] * 40])
+    amortization = amortize(cashflows, [10000.0], interest=np.array([[4900.0] * 40]))
+    assert abs(np.nansum(amortization.amortizedfee) - (40 * 5000 - 10000 - 40 * 4900)) < 1e-6
+
+
+def test_cached_schedules_amortize_alike(tape):
+    fee = tape['upfrontfee'].values
+    direct = amortize_schedule(generate_portfolio_schedule(tape), fee)
+    cached = amortize_schedule(ScheduleCache().schedule(tape), fee)
+    np.testing.assert_allclose(cached.eirrunningbalance, direct.eirrunningbalance, rtol=1e-9, atol=1e-6)
+    np.testing.assert_allclose(np.nansum(cached.amortizedfee, axis=1), np.nansum(direct.amortizedfee, axis=1),
+                               rtol=1e-9, atol=1e-6)
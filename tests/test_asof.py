@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from eir.amortization import amortize_schedule
+from eir.asof import asof, loan_eir, payment_count
+from eir.ratecurve import rate_curve
+from eir.schedule import generate_portfolio_schedule
+
+
+def _batch(tape, k, curve=None):
+    # contractual balance, interest paid and carrying amount after k repayments, from the batch schedules
+    schedule = generate_portfolio_schedule(tape, curve=curve)
+    amortization = amortize_schedule(schedule, tape['upfrontfee'].values)
+    made = np.arange(schedule.num_periods) < k[:, None]
+    balance = tape['originalamount'].values - np.nansum(np.where(made, schedule.principal, 0.0), axis=1)
+    interest = np.nansum(np.where(made, schedule.interest, 0.0), axis=1)
+    rows = np.arange(len(tape))
+    carrying = np.where(k < schedule.num_repayments,
+                        amortization.eirrunningbalance[rows, np.minimum(k, schedule.num_repayments - 1)], 0.0)
+    return schedule, amortization, balance, interest, carrying
+
+
+@pytest.mark.parametrize('roll', ['carry', 'eom'])
+def test_dates_count_the_repayments_made(tape, roll):
+    schedule = generate_portfolio_schedule(tape, roll)
+    for when in ('2020-02-29', '2022-06-30', '2023-01-31'):
+        expected = np.count_nonzero(schedule.dates <= np.datetime64(when), axis=1)
+        result = asof(tape, when, roll=roll)
+        np.testing.assert_array_equal(result.period, expected)
+
+
+@pytest.mark.parametrize('k', [0, 1, 7, 20, 1000])
+def test_asof_matches_the_batch_schedule(tape, k):
+    result = asof(tape, k)
+    schedule, amortization, balance, interest, carrying = _batch(tape, result.period)
+    scale = np.maximum(1.0, tape['originalamount'].values)
+    for name, expected in (('balance', balance), ('interest', interest), ('carrying', carrying)):
+        assert (np.abs(getattr(result, name) - expected) <= 1e-8 * scale).all(), name
+    np.testing.assert_allclose(result.unamortizedfee, result.balance - result.carrying)
+    np.testing.assert_allclose(loan_eir(tape), amortization.eir, rtol=1e-10)
+
+
+def test_floating_loans_follow_the_curve(tape):
+    curve = rate_curve(np.array(['2018-01-01', '2021-01-01', '2023-01-01'], dtype='datetime64[D]'),
+                       np.array([1.0, 3.0, 5.0]))
+    floating = tape.assign(margin=np.where(np.arange(len(tape)) % 2, 1.5, np.nan))
+    result = asof(floating, 12, curve=curve)
+    schedule, amortization, balance, interest, carrying = _batch(floating, result.period, curve)
+    scale = np.maximum(1.0, floating['originalamount'].values)
+    assert (np.abs(result.carrying - carrying) <= 1e-8 * scale).all()
+    assert (np.abs(result.balance - balance) <= 1e-8 * scale).all()
+    np.testing.assert_allclose(loan_eir(floating, curve=curve), amortization.eir, rtol=1e-10)
+
+
+def test_payment_count_clips_like_the_calendar():
+    count = payment_count(np.array(['2023-01-31'] * 3, dtype='datetime64[D]'), np.array([1, 1, 1]),
+                          np.array([24, 24, 24]), np.array(['2023-02-27', '2023-02-28', '2023-03-28'],
+                                                           dtype='datetime64[D]'))
+    np.testing.assert_array_equal(count, [0, 1, 2])
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from eir.delta import delta_run, write_store_csv
+from eir.pipeline import run_pipeline
+
+from .conftest import loan_tape
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _changed(tape):
+    # a later snapshot: ten loans repriced, the last twenty paid off and fifteen new ones
+    tape = tape.copy()
+    tape.loc[tape.index[:10], 'interestrate'] += 1
+    new = loan_tape(15, seed=11)
+    new['loanid'] = ['N%d' % i for i in range(len(new))]
+    return pd.concat([tape.iloc[:-20], new], ignore_index=True)
+
+
+def test_store_csv_matches_the_pipeline(tape_csv, tmp_path):
+    store = str(tmp_path / 'store')
+    stats = delta_run(tape_csv, store, chunksize=70)
+    assert (stats.reused, stats.recomputed, stats.deleted) == (0, 300, 0)
+    expected = str(tmp_path / 'expected.csv')
+    output = str(tmp_path / 'store.csv')
+    run_pipeline(tape_csv, expected, chunksize=70)
+    write_store_csv(tape_csv, store, output)
+    assert _read(output) == _read(expected)
+
+
+def test_delta_run_matches_a_full_run(tape, tape_csv, tmp_path):
+    store = str(tmp_path / 'store')
+    delta_run(tape_csv, store, chunksize=70)
+    later = str(tmp_path / 'later.csv')
+    _changed(tape).to_csv(later, index=False)
+
+    stats = delta_run(later, store, chunksize=70, workers=2)
+    assert (stats.reused, stats.recomputed, stats.deleted) == (270, 25, 20)
+    expected = str(tmp_path / 'expected.csv')
+    output = str(tmp_path / 'store.csv')
+    run_pipeline(later, expected, chunksize=70)
+    write_store_csv(later, store, output)
+    assert _read(output) == _read(expected)
+
+    # nothing changed since the last run
+    stats = delta_run(later, store, chunksize=70)
+    assert (stats.reused, stats.recomputed, stats.deleted) == (295, 0, 0)
+
+
+def test_delta_run_needs_loanids(tape, tmp_path):
+    path = str(tmp_path / 'tape.csv')
+    tape.drop(columns='loanid').to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        delta_run(path, str(tmp_path / 'store'))
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from eir.eirsolver import eirfunc, solve_cashflow_eir, solve_eir
+
+brentq = pytest.importorskip('scipy.optimize').brentq
+
+
+def _annuity_root(installment, n, pv):
+    return brentq(lambda x: installment * (1 - (1 + x) ** -n) / x - pv, 1e-9, 10, xtol=1e-15, rtol=1e-14)
+
+
+def test_solve_eir_matches_brentq():
+    rng = np.random.default_rng(1)
+    n = rng.integers(1, 361, 200)
+    rate = rng.uniform(0.0005, 0.05, 200)
+    pv = rng.uniform(1000, 100000, 200)
+    installment = pv * rate / (1 - (1 + rate) ** -n) * rng.uniform(1.0, 1.05, 200)
+    solution = solve_eir(installment, n, pv)
+    assert solution.converged.all()
+    expected = [_annuity_root(*args) for args in zip(installment, n, pv)]
+    np.testing.assert_allclose(solution.rate, expected, rtol=1e-10, atol=1e-14)
+    np.testing.assert_allclose(eirfunc(installment, n, pv), np.asarray(expected) * 100 * 12, rtol=1e-10, atol=1e-12)
+
+
+def test_solve_eir_edge_cases():
+    # zero rate, a negative rate and an input with no solution
+    solution = solve_eir([100.0, 100.0, 100.0], [12, 12, 12], [1200.0, 1300.0, -5.0])
+    assert solution.rate[0] == pytest.approx(0.0, abs=1e-14)
+    assert solution.rate[1] < 0 and solution.converged[1]
+    assert np.isnan(solution.rate[2]) and not solution.converged[2]
+
+def test_solve_cashflow_eir_matches_brentq():
+    rng = np.random.default_rng(2)
+    flows = np.full((50, 60), np.nan)
+    pv = np.empty(50)
+    for i in range(50):
+        n = rng.integers(1, 61)
+        flows[i, :n] = rng.uniform(50, 500, n)
+        pv[i] = flows[i, :n].sum() * rng.uniform(0.6, 0.99)
+    solution = solve_cashflow_eir(flows, pv)
+    assert solution.converged.all()
+    for i in range(50):
+        cashflows = flows[i][~np.isnan(flows[i])]
+        periods = np.arange(1, len(cashflows) + 1)
+        expected = brentq(lambda x: np.sum(cashflows / (1 + x) ** periods) - pv[i], 1e-12, 10, xtol=1e-15,
+                          rtol=1e-14)
+        assert solution.rate[i] == pytest.approx(expected, rel=1e-10)
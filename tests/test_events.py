@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from eir.amortization import amortize_schedule
+from eir.events import LoanEvent, apply_event, loan_schedule
+from eir.ratecurve import rate_curve
+from eir.schedule import generate_portfolio_schedule
+
+loan = dict(loanstartdate='2023-01-30', loanenddate='2026-01-30', originalamount=10000.0, repaymentfrequency='monthly',
+            interestrate=9.0, upfrontfee=250.0, repaymenttype='emi', interest_calculation_method='monthly',
+            base_days=365, interest_type='variable')
+
+curve = rate_curve(np.array(['2022-01-01', '2023-06-01', '2024-01-01'], dtype='datetime64[D]'),
+                   np.array([3.0, 5.0, 4.0]))
+
+
+def _schedule(loan, roll='carry', curve=None):
+    schedule = generate_portfolio_schedule({name: [value] for name, value in loan.items()}, roll, curve)
+    return loan_schedule(schedule, amortize_schedule(schedule, [loan['upfrontfee']]), 0)
+
+
+@pytest.mark.parametrize('event', [LoanEvent('2023-06-20', 'prepayment', 3000.0),
+                                   LoanEvent('2023-06-20', 'restructure', rate=6.0, term=12),
+                                   LoanEvent('2023-06-20', 'restructure', term=40),
+                                   LoanEvent('2023-06-20', 'ratereset', rate=12.0)])
+def test_fee_and_catchup_add_up_to_the_upfront_fee(event):
+    schedule = _schedule(loan)
+    result = apply_event(loan, schedule, event)
+    k = result.first_period
+    for name in ('principal', 'interest', 'eirinterest', 'amortizedfee'):
+        np.testing.assert_array_equal(getattr(result.schedule, name)[:k], getattr(schedule, name)[:k])
+    assert np.nansum(result.schedule.amortizedfee) + result.catchup == pytest.approx(loan['upfrontfee'], abs=1e-8)
+    if event.type == 'ratereset':
+        assert result.catchup == 0
+
+
+def test_nothing_changed_means_no_catchup():
+    schedule = _schedule(loan)
+    result = apply_event(loan, schedule, LoanEvent('2023-06-20', 'prepayment', 0.0))
+    np.testing.assert_allclose(result.schedule.total_payment, schedule.total_payment, atol=1e-9)
+    assert result.catchup == pytest.approx(0.0, abs=1e-8)
+
+
+def test_eom_tail_keeps_the_payment_day():
+    schedule = _schedule(loan, roll='eom')
+    result = apply_event(loan, schedule, LoanEvent('2023-03-05', 'prepayment', 1000.0), roll='eom')
+    np.testing.assert_array_equal(result.schedule.dates, schedule.dates)
+    assert str(result.schedule.dates[3]) == '2023-05-30'
+
+
+def test_margin_reset_of_a_floating_loan():
+    floating = dict(loan, margin=2.0)
+    schedule = _schedule(floating, curve=curve)
+    same = apply_event(floating, schedule, LoanEvent('2023-06-20', 'ratereset', margin=2.0), curve=curve)
+    np.testing.assert_allclose(same.schedule.total_payment, schedule.total_payment, atol=1e-9)
+    assert same.schedule.eir == pytest.approx(schedule.eir, rel=1e-12)
+    wider = apply_event(floating, schedule, LoanEvent('2023-06-20', 'ratereset', margin=3.0), curve=curve)
+    assert wider.schedule.eir > schedule.eir
+    assert np.nansum(wider.schedule.amortizedfee) == pytest.approx(floating['upfrontfee'], abs=1e-8)
+
+
+@pytest.mark.parametrize('event, floating', [
+    (LoanEvent('2023-06-20', 'prepayment'), False),
+    (LoanEvent('2023-06-20', 'ratereset'), False),
+    (LoanEvent('2023-06-20', 'restructure'), False),
+    (LoanEvent('2023-06-20', 'restructure', term=0), False),
+    (LoanEvent('2023-06-20', 'ratereset', margin=1.0), False),
+    (LoanEvent('2023-06-20', 'ratereset', rate=5.0), True),
+    (LoanEvent('2023-06-20', 'writeoff'), False),
+    (LoanEvent('2030-01-01', 'prepayment', 10.0), False),
+    (LoanEvent('2023-06-20', 'prepayment', 1e9), False),
+])
+def test_invalid_events_raise(event, floating):
+    target, on = (dict(loan, margin=2.0), curve) if floating else (loan, None)
+    schedule = _schedule(target, curve=on)
+    with pytest.raises(ValueError):
+        apply_event(target, schedule, event, curve=on)
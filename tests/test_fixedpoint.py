@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from eir.fixedpoint import FixedPoint, fixed_point_schedule, rounding_modes, to_minor
+from eir.pipeline import compute_chunk
+from eir.schedule import generate_portfolio_schedule
+
+
+@pytest.mark.parametrize('rounding', rounding_modes)
+def test_minor_units_add_up_exactly(tape, rounding):
+    schedule = generate_portfolio_schedule(tape)
+    fixed = FixedPoint(100, rounding)
+    minor = fixed_point_schedule(tape, schedule, tape['upfrontfee'].values, fixed)
+    amount = to_minor(tape['originalamount'].values, 100, rounding)
+    fee = to_minor(tape['upfrontfee'].values, 100, rounding)
+    assert minor.principal.dtype == np.int64
+    np.testing.assert_array_equal(minor.principal.sum(axis=1), amount)
+    np.testing.assert_array_equal(minor.total_payment, minor.principal + minor.interest)
+    np.testing.assert_array_equal(minor.amortizedfee.sum(axis=1), fee)
+    last = np.arange(len(tape)), schedule.num_repayments - 1
+    np.testing.assert_array_equal(minor.eirrunningbalance[last] + minor.eirinterest[last] - minor.total_payment[last],
+                                  0)
+
+
+def test_cents_table_has_whole_cents(tape):
+    table = compute_chunk(tape, fixed=FixedPoint(100, 'half_even'))
+    cents = table.column('Principal') * 100
+    assert (np.abs(cents - np.round(cents)) < 1e-6).all()
+    totals = np.bincount(table.loan, weights=np.round(cents))
+    np.testing.assert_array_equal(totals, np.round(tape['originalamount'].values * 100))
@@ -0,0 +1,39 @@
+import pytest
+
+from eir.pipeline import run_pipeline
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_resumed_run_is_byte_identical(tape_csv, tmp_path):
+    expected = str(tmp_path / 'expected.csv')
+    run_pipeline(tape_csv, expected, chunksize=70)
+
+    output = str(tmp_path / 'resumed.csv')
+
+    def stop_after_two(stats):
+        if stats.chunks == 2:
+            raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        run_pipeline(tape_csv, output, chunksize=70, progress=stop_after_two)
+    # rows of a chunk that was being written when the run died
+    with open(output, 'ab') as f:
+        f.write(b'L140,1,2020-01-01,1.0')
+    stats = run_pipeline(tape_csv, output, chunksize=70, resume=True)
+    assert stats.loans == 300
+    assert _read(output) == _read(expected)
+
+
+def test_resume_rejects_another_chunk_size(tape_csv, tmp_path):
+    output = str(tmp_path / 'schedule.csv')
+    run_pipeline(tape_csv, output, chunksize=70)
+    with pytest.raises(ValueError):
+        run_pipeline(tape_csv, output, chunksize=100, resume=True)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from eir.pipeline import run_pipeline
+from eir.runner import run_portfolio
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_workers_write_the_same_bytes(tape_csv, tmp_path):
+    serial = str(tmp_path / 'serial.csv')
+    parallel = str(tmp_path / 'parallel.csv')
+    run_pipeline(tape_csv, serial, chunksize=70)
+    run_pipeline(tape_csv, parallel, chunksize=70, workers=2)
+    assert _read(parallel) == _read(serial)
+
+
+def test_chunk_size_does_not_change_the_output(tape_csv, tmp_path):
+    small = str(tmp_path / 'small.csv')
+    large = str(tmp_path / 'large.csv')
+    run_pipeline(tape_csv, small, chunksize=33)
+    run_pipeline(tape_csv, large, chunksize=1000)
+    assert _read(small) == _read(large)
+
+
+def test_run_portfolio_is_independent_of_workers(tape):
+    serial = run_portfolio(tape, workers=1, chunksize=1000).table.to_pandas()
+    parallel = run_portfolio(tape, workers=2, chunksize=45).table.to_pandas()
+    assert list(parallel.columns) == list(serial.columns)
+    for name in serial.columns:
+        np.testing.assert_array_equal(parallel[name].values, serial[name].values)
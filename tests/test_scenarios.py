@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from eir.amortization import amortize_schedule
+from eir.eirsolver import solve_cashflow_eir
+from eir.scenarios import ScenarioEngine, shock_tape
+from eir.schedule import generate_portfolio_schedule
+
+asof = '2022-06-30'
+
+
+def test_zero_shock_matches_the_batch_engine(tape):
+    schedule = generate_portfolio_schedule(tape)
+    fee = tape['upfrontfee'].values
+    amortization = amortize_schedule(schedule, fee)
+    result = ScenarioEngine(tape, asof, floor=None).evaluate([-100, 0, 100])
+
+    annual = amortization.eir * 100 * (12 // schedule.repayment_interval)
+    np.testing.assert_allclose(result.eir[:, 1], annual, rtol=1e-10)
+    paid = np.count_nonzero(schedule.dates <= np.datetime64(asof), axis=1)
+    rows = np.arange(len(tape))
+    carrying = np.where(paid < schedule.num_repayments,
+                        amortization.eirrunningbalance[rows, np.minimum(paid, schedule.num_repayments - 1)], 0.0)
+    made = np.arange(schedule.num_periods) < paid[:, None]
+    fee_so_far = np.nansum(np.where(made, amortization.amortizedfee, 0.0), axis=1)
+    scale = tape['originalamount'].values
+    assert (np.abs(result.carrying[:, 1] - carrying) <= 1e-9 * scale).all()
+    assert (np.abs(result.amortizedfee[:, 1] - fee_so_far) <= 1e-9 * scale).all()
+
+
+def test_shocks_move_only_variable_loans(tape):
+    result = ScenarioEngine(tape, asof).evaluate([-50, 0, 50])
+    flat = (tape['interest_type'] == 'flatrate').values
+    np.testing.assert_array_equal(result.eir[flat, 0], result.eir[flat, 2])
+    assert (result.eir[~flat, 2] > result.eir[~flat, 0]).all()
+
+
+def test_a_guess_gives_the_same_rate():
+    rng = np.random.default_rng(3)
+    flows = rng.uniform(100, 200, (40, 24))
+    pv = flows.sum(axis=1) * 0.9
+    seeded = solve_cashflow_eir(flows, pv)
+    guessed = solve_cashflow_eir(flows, pv, guess=seeded.rate * 1.2)
+    np.testing.assert_allclose(guessed.rate, seeded.rate, rtol=1e-11)
+
+
+def test_shock_columns(tape_csv):
+    frame = next(shock_tape(tape_csv, asof, [-12.5, 0, 12.75]))
+    assert list(frame.columns[1:4]) == ['eir_-12.5bp', 'eir_+0bp', 'eir_+12.75bp']
+    with pytest.raises(ValueError):
+        next(shock_tape(tape_csv, asof, [0, 0]))
+
+
+def test_floating_loans_are_rejected(tape):
+    with pytest.raises(ValueError):
+        ScenarioEngine(tape.assign(margin=1.0), asof)
@@ -0,0 +1,25 @@
+import numpy as np
+
+from eir import finaleir
+from eir.amortization import amortize_schedule
+from eir.schedule import generate_portfolio_schedule, loan_columns
+
+
+def test_batch_matches_finaleir(tape):
+    # the batch engine reproduces the per-loan script, amounts to 1e-9 of the loan amount
+    loans = tape.iloc[:80]
+    schedule = generate_portfolio_schedule(loans)
+    amortization = amortize_schedule(schedule, loans['upfrontfee'].values)
+    for i, loan in enumerate(loans[loan_columns].itertuples(index=False)):
+        expected = finaleir.generate_loan_repayment_schedule(*loan)
+        n = schedule.num_repayments[i]
+        assert n == len(expected)
+        scale = loan.originalamount
+        np.testing.assert_array_equal(schedule.dates[i, :n], expected['Date'].values.astype('datetime64[D]'))
+        for name, values in [('Principal', schedule.principal), ('Interest', schedule.interest),
+                             ('Total Payment', schedule.total_payment),
+                             ('Running Balance', schedule.running_balance),
+                             ('eirinterest', amortization.eirinterest), ('armortizedfee', amortization.amortizedfee)]:
+            np.testing.assert_allclose(values[i, :n], expected[name].values, rtol=0, atol=1e-9 * scale, err_msg=name)
+        annual = amortization.eir[i] * 100 * (12 // schedule.repayment_interval[i])
+        np.testing.assert_allclose(annual, expected['eir'].values[0], rtol=1e-9)